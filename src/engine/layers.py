@@ -11,6 +11,72 @@ def assert_int(val):
         raise ValueError("value is not an int: {}".format(val))
 
 
+_BLANK_GLYPH = 0xFFFF  # see RenderEngine140
+
+
+class _GLBuffer:
+    """
+        A gl buffer object that mirrors a numpy array. Only the range that's been marked
+        dirty gets uploaded when it's synced, the rest stays on the gpu between frames.
+    """
+
+    def __init__(self, target, dtype):
+        """
+            target: GL_ARRAY_BUFFER or GL_ELEMENT_ARRAY_BUFFER
+            dtype: the numpy type the data should have on the gpu.
+        """
+        self._target = target
+        self._dtype = numpy.dtype(dtype)
+        self._buffer_id = None
+        self._capacity = 0  # in elements
+
+        self._dirty_start = 0
+        self._dirty_end = 0
+
+    def mark_dirty(self, start, end):
+        """start, end: range of array elements (not bytes) that have changed."""
+        if self._dirty_start >= self._dirty_end:
+            self._dirty_start = start
+            self._dirty_end = end
+        else:
+            self._dirty_start = min(self._dirty_start, start)
+            self._dirty_end = max(self._dirty_end, end)
+
+    def reset(self, delete=True):
+        """forgets the gl buffer. it'll be recreated and fully re-uploaded on the next sync.
+           delete: whether to delete the old buffer too. pass False if the context it lived in is gone."""
+        if delete and self._buffer_id is not None:
+            glDeleteBuffers(1, [self._buffer_id])
+        self._buffer_id = None
+        self._capacity = 0
+
+    def bind(self):
+        glBindBuffer(self._target, self._buffer_id)
+
+    def sync(self, array):
+        """uploads whatever's changed in the array, and leaves the buffer bound."""
+        if self._buffer_id is None:
+            self._buffer_id = glGenBuffers(1)
+
+        glBindBuffer(self._target, self._buffer_id)
+
+        if len(array) > self._capacity:
+            # leave some headroom so that layers that grow a little at a time don't re-allocate every frame
+            self._capacity = max(len(array), self._capacity * 2, 64)
+            glBufferData(self._target, self._capacity * self._dtype.itemsize, None, GL_DYNAMIC_DRAW)
+            self._dirty_start = 0
+            self._dirty_end = len(array)
+
+        start = self._dirty_start
+        end = min(self._dirty_end, len(array))
+        if start < end:
+            data = numpy.ascontiguousarray(array[start:end], dtype=self._dtype)
+            glBufferSubData(self._target, start * self._dtype.itemsize, data.nbytes, data)
+
+        self._dirty_start = 0
+        self._dirty_end = 0
+
+
 class _Layer:
 
     def __init__(self, layer_id, layer_depth, sort_sprites=True, use_color=True):
@@ -79,6 +145,11 @@ class _Layer:
     def render(self, engine):
         raise NotImplementedError()
 
+    def reset_buffers(self, context_lost):
+        """called when the display mode changes. any gl buffers the layer holds should be recreated.
+           context_lost: whether the old gl context is gone (and its buffers with it)."""
+        pass
+
     def __contains__(self, sprite_id):
         raise NotImplementedError()
 
@@ -96,14 +167,21 @@ class ImageLayer(_Layer):
 
         self.images = []  # ordered list of image ids
         self._image_set = set()  # set of image ids
+        self._slots = {}  # image id -> index in images (and in the gl arrays), for images that have been built
 
         self._last_known_last_modified_ticks = {}  # image id -> int
 
         # these are the pointers the layer passes to gl
-        self.vertices = numpy.array([], dtype=float)
-        self.tex_coords = numpy.array([], dtype=float)
-        self.indices = numpy.array([], dtype=float)
-        self.colors = numpy.array([], dtype=float) if use_color else None
+        self.vertices = numpy.array([], dtype=numpy.float32)
+        self.tex_coords = numpy.array([], dtype=numpy.float32)
+        self.indices = numpy.array([], dtype=numpy.uint32)
+        self.colors = numpy.array([], dtype=numpy.uint8) if use_color else None  # normalized rgb
+
+        # and these are their copies on the gpu
+        self._vertex_buffer = _GLBuffer(GL_ARRAY_BUFFER, self.vertices.dtype)
+        self._tex_coord_buffer = _GLBuffer(GL_ARRAY_BUFFER, self.tex_coords.dtype)
+        self._color_buffer = _GLBuffer(GL_ARRAY_BUFFER, self.colors.dtype) if use_color else None
+        self._index_buffer = _GLBuffer(GL_ELEMENT_ARRAY_BUFFER, self.indices.dtype)
 
         self._dirty_sprites = []
         self._to_remove = []
@@ -145,6 +223,57 @@ class ImageLayer(_Layer):
     def color_stride(self):
         return 4 * 3
 
+    def _resize_arrays(self, n_sprites):
+        # need refcheck to be false or else Pycharm's debugger can cause this to fail (due to holding a ref)
+        # (resize keeps the existing data at the front, which is what lets us rebuild incrementally)
+        self.vertices.resize(self.vertex_stride() * n_sprites, refcheck=False)
+        self.tex_coords.resize(self.texture_stride() * n_sprites, refcheck=False)
+        self.indices.resize(self.index_stride() * n_sprites, refcheck=False)
+        if self.is_color():
+            self.colors.resize(self.color_stride() * n_sprites, refcheck=False)
+
+    def _write_slot(self, i, sprite_info_lookup):
+        sprite = sprite_info_lookup[self.images[i]].sprite
+        sprite.add_urself(
+            i,
+            self.vertices,
+            self.tex_coords,
+            self.colors,
+            self.indices)
+        self._mark_slots_dirty(i, i + 1)
+
+    def _write_slots(self, slots, sprite_info_lookup):
+        if len(slots) < 16:
+            # not worth the numpy overhead
+            for i in slots:
+                self._write_slot(i, sprite_info_lookup)
+        else:
+            sprite_list = [sprite_info_lookup[self.images[i]].sprite for i in slots]
+            sprites.add_image_sprites(sprite_list, slots, self.vertices, self.tex_coords, self.colors, self.indices)
+            self._mark_slots_dirty(min(slots), max(slots) + 1)
+
+    def _mark_slots_dirty(self, start, end, indices_too=False):
+        self._vertex_buffer.mark_dirty(start * self.vertex_stride(), end * self.vertex_stride())
+        self._tex_coord_buffer.mark_dirty(start * self.texture_stride(), end * self.texture_stride())
+        if self.is_color():
+            self._color_buffer.mark_dirty(start * self.color_stride(), end * self.color_stride())
+        if indices_too:
+            self._index_buffer.mark_dirty(start * self.index_stride(), end * self.index_stride())
+
+    def _move_slot(self, src, dest):
+        """copies a sprite's data from one slot to another. indices depend only on the slot, so they stay put."""
+        arrays = [(self.vertices, self.vertex_stride()), (self.tex_coords, self.texture_stride())]
+        if self.is_color():
+            arrays.append((self.colors, self.color_stride()))
+        for array, stride in arrays:
+            array[dest * stride:(dest + 1) * stride] = array[src * stride:(src + 1) * stride]
+
+        self._mark_slots_dirty(dest, dest + 1)
+
+        sprite_id = self.images[src]
+        self.images[dest] = sprite_id
+        self._slots[sprite_id] = dest
+
     def rebuild(self, sprite_info_lookup):
         if len(self._to_remove) > 0:
             # this is all here to handle the case where you add and remove a sprite on the same frame
@@ -154,37 +283,50 @@ class ImageLayer(_Layer):
                 if sprite_id in self._last_known_last_modified_ticks:
                     del self._last_known_last_modified_ticks[sprite_id]
 
-            util.Utils.remove_all_from_list_in_place(self.images, self._to_remove)
             util.Utils.remove_all_from_list_in_place(self._to_add, self._to_remove)
+
+            if self.is_sorted():
+                util.Utils.remove_all_from_list_in_place(self.images, self._to_remove)
+            else:
+                # fill each hole with the last sprite so everything else can stay where it is
+                for sprite_id in self._to_remove:
+                    if sprite_id in self._slots:
+                        slot = self._slots.pop(sprite_id)
+                        last = len(self.images) - 1
+                        if slot != last:
+                            self._move_slot(last, slot)
+                        self.images.pop()
             self._to_remove.clear()
 
-        if len(self._to_add) > 0:
+        if self.is_sorted():
+            # depths can change, so sorted layers just rebuild everything
+            first_new_slot = len(self.images)
             self.images.extend(self._to_add)
             self._to_add.clear()
+            self._dirty_sprites.clear()
 
-        self._dirty_sprites.clear()
-
-        if self.is_sorted():
             self.images.sort(key=lambda x: -sprite_info_lookup[x].sprite.depth())
+            self._resize_arrays(len(self.images))
+            self._write_slots(range(0, len(self.images)), sprite_info_lookup)
+            self._index_buffer.mark_dirty(first_new_slot * self.index_stride(), len(self.indices))
+            return
+
+        first_new_slot = len(self.images)
+        for sprite_id in self._to_add:
+            self._slots[sprite_id] = len(self.images)
+            self.images.append(sprite_id)
+        self._to_add.clear()
+
+        self._resize_arrays(len(self.images))
+        self._mark_slots_dirty(first_new_slot, len(self.images), indices_too=True)
+
+        to_write = list(range(first_new_slot, len(self.images)))
+        for sprite_id in self._dirty_sprites:
+            if sprite_id in self._slots and self._slots[sprite_id] < first_new_slot:
+                to_write.append(self._slots[sprite_id])
+        self._dirty_sprites.clear()
 
-        n_sprites = len(self.images)
-
-        # need refcheck to be false or else Pycharm's debugger can cause this to fail (due to holding a ref)
-        self.vertices.resize(self.vertex_stride() * n_sprites, refcheck=False)
-        self.tex_coords.resize(self.texture_stride() * n_sprites, refcheck=False)
-        self.indices.resize(self.index_stride() * n_sprites, refcheck=False)
-        if self.is_color():
-            self.colors.resize(self.color_stride() * n_sprites, refcheck=False)
-
-        # TODO - we only need to iterate over dirty indices here
-        for i in range(0, n_sprites):
-            sprite = sprite_info_lookup[self.images[i]].sprite
-            sprite.add_urself(
-                i,
-                self.vertices,
-                self.tex_coords,
-                self.colors,
-                self.indices)
+        self._write_slots(to_write, sprite_info_lookup)
 
     def render(self, engine):
         # split up like this to make it easier to find performance bottlenecks
@@ -200,13 +342,26 @@ class ImageLayer(_Layer):
             engine.set_colors_enabled(enable)
 
     def _pass_attributes(self, engine):
-        engine.set_vertices(self.vertices)
-        engine.set_texture_coords(self.tex_coords)
+        # with a buffer bound, the attribute "pointers" are offsets into the buffer
+        self._vertex_buffer.sync(self.vertices)
+        engine.set_vertices(None)
+        self._tex_coord_buffer.sync(self.tex_coords)
+        engine.set_texture_coords(None)
         if self.is_color():
-            engine.set_colors(self.colors)
+            self._color_buffer.sync(self.colors)
+            engine.set_colors(None)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
 
     def _draw_elements(self):
-        glDrawElements(GL_TRIANGLES, len(self.indices), GL_UNSIGNED_INT, self.indices)
+        if len(self.indices) > 0:
+            self._index_buffer.sync(self.indices)
+            glDrawElements(GL_TRIANGLES, len(self.indices), GL_UNSIGNED_INT, None)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def reset_buffers(self, context_lost):
+        for buf in (self._vertex_buffer, self._tex_coord_buffer, self._color_buffer, self._index_buffer):
+            if buf is not None:
+                buf.reset(delete=not context_lost)
 
     def __contains__(self, uid):
         return uid in self._image_set
@@ -227,6 +382,10 @@ class PolygonLayer(ImageLayer):
     def accepts_sprite_type(self, sprite_type):
         return sprite_type == sprites.SpriteTypes.TRIANGLE
 
+    def _write_slots(self, slots, sprite_info_lookup):
+        for i in slots:
+            self._write_slot(i, sprite_info_lookup)
+
     def vertex_stride(self):
         return 6
 
@@ -242,3 +401,200 @@ class PolygonLayer(ImageLayer):
 
 
 
+
+
+class CharGridLayer(_Layer):
+    """
+        Layer for a fixed grid of same-sized character cells. It doesn't hold sprites, the
+        glyph and color of each cell are written into it directly via set_cell.
+    """
+
+    def __init__(self, layer_id, layer_depth, grid_w, grid_h, cell_size):
+        """
+            grid_w, grid_h: The number of cells in the grid.
+            cell_size: The (w, h) of each cell, in pixels.
+        """
+        _Layer.__init__(self, layer_id, layer_depth, sort_sprites=False, use_color=True)
+        self._grid_w = grid_w
+        self._grid_h = grid_h
+        self._cell_size = cell_size
+        self._origin = (0, 0)
+
+        n = grid_w * grid_h
+        self._models = [None] * n  # cell idx -> ImageModel
+        self._cell_colors = [None] * n  # cell idx -> (r, g, b)
+
+        self.vertices = numpy.zeros(self.vertex_stride() * n, dtype=numpy.float32)
+        self.tex_coords = numpy.zeros(self.texture_stride() * n, dtype=numpy.float32)
+        self.colors = numpy.full(self.color_stride() * n, 255, dtype=numpy.uint8)
+
+        # the cells never move relative to each other, so the indices are built once.
+        # the grid's size is fixed too, so we can usually get away with 16-bit ones.
+        self._index_type = numpy.uint16 if n * 4 <= 2 ** 16 else numpy.uint32
+        quad = numpy.array([0, 1, 2, 0, 2, 3], dtype=self._index_type)
+        self.indices = numpy.arange(n, dtype=self._index_type).repeat(6) * 4 + numpy.tile(quad, n)
+
+        self._vertex_buffer = _GLBuffer(GL_ARRAY_BUFFER, self.vertices.dtype)
+        self._tex_coord_buffer = _GLBuffer(GL_ARRAY_BUFFER, self.tex_coords.dtype)
+        self._color_buffer = _GLBuffer(GL_ARRAY_BUFFER, self.colors.dtype)
+        self._index_buffer = _GLBuffer(GL_ELEMENT_ARRAY_BUFFER, self.indices.dtype)
+
+        # for engines that can draw the grid with instancing, each cell is just its glyph's atlas position and its color
+        self.glyphs = numpy.full(2 * n, _BLANK_GLYPH, dtype=numpy.uint16)  # (tx1, ty1) per cell
+        self.cell_colors = numpy.full(3 * n, 255, dtype=numpy.uint8)
+        self._glyph_buffer = _GLBuffer(GL_ARRAY_BUFFER, self.glyphs.dtype)
+        self._cell_color_buffer = _GLBuffer(GL_ARRAY_BUFFER, self.cell_colors.dtype)
+
+        self._build_vertices()
+        self._dirty = True
+
+    def set_origin(self, x, y):
+        """sets the position of the grid's top-left corner."""
+        if (x, y) != self._origin:
+            self._origin = (x, y)
+            self._build_vertices()
+            self._dirty = True
+
+    def _build_vertices(self):
+        cw, ch = self._cell_size
+        xs = numpy.tile(numpy.arange(self._grid_w, dtype=numpy.float32) * cw + self._origin[0], self._grid_h)
+        ys = numpy.repeat(numpy.arange(self._grid_h, dtype=numpy.float32) * ch + self._origin[1], self._grid_w)
+
+        verts = self.vertices.reshape(-1, 8)
+        verts[:, 0] = xs
+        verts[:, 1] = ys
+        verts[:, 2] = xs
+        verts[:, 3] = ys + ch
+        verts[:, 4] = xs + cw
+        verts[:, 5] = ys + ch
+        verts[:, 6] = xs + cw
+        verts[:, 7] = ys
+
+        # blank cells get squashed down to nothing
+        for idx in range(0, len(self._models)):
+            if self._models[idx] is None:
+                verts[idx, 2:] = verts[idx, 0:2].tolist() * 3
+
+        self._vertex_buffer.mark_dirty(0, len(self.vertices))
+
+    def set_cell(self, x, y, model, color):
+        """
+            model: the ImageModel to draw in the cell, or None to leave it blank.
+            color: (r, g, b) tuple of floats between 0 and 1.0
+        """
+        idx = y * self._grid_w + x
+        if model is not self._models[idx]:
+            if model is None or self._models[idx] is None:
+                self._models[idx] = model
+                self._write_vertices(idx)
+            else:
+                self._models[idx] = model
+            if model is not None:
+                self.tex_coords[idx * 8:(idx + 1) * 8] = (model.tx1, model.ty2,
+                                                          model.tx1, model.ty1,
+                                                          model.tx2, model.ty1,
+                                                          model.tx2, model.ty2)
+                self._tex_coord_buffer.mark_dirty(idx * 8, (idx + 1) * 8)
+                self.glyphs[idx * 2:(idx + 1) * 2] = (model.tx1, model.ty1)
+            else:
+                self.glyphs[idx * 2] = _BLANK_GLYPH
+            self._glyph_buffer.mark_dirty(idx * 2, (idx + 1) * 2)
+            self._dirty = True
+
+        if color != self._cell_colors[idx]:
+            self._cell_colors[idx] = color
+            rgb = sprites.color_to_bytes(tuple(color))
+            self.colors[idx * 12:(idx + 1) * 12] = rgb * 4
+            self._color_buffer.mark_dirty(idx * 12, (idx + 1) * 12)
+            self.cell_colors[idx * 3:(idx + 1) * 3] = rgb
+            self._cell_color_buffer.mark_dirty(idx * 3, (idx + 1) * 3)
+            self._dirty = True
+
+    def _write_vertices(self, idx):
+        x = self._origin[0] + (idx % self._grid_w) * self._cell_size[0]
+        y = self._origin[1] + (idx // self._grid_w) * self._cell_size[1]
+        if self._models[idx] is None:
+            self.vertices[idx * 8:(idx + 1) * 8] = (x, y) * 4
+        else:
+            w, h = self._cell_size
+            self.vertices[idx * 8:(idx + 1) * 8] = (x, y, x, y + h, x + w, y + h, x + w, y)
+        self._vertex_buffer.mark_dirty(idx * 8, (idx + 1) * 8)
+
+    def is_dirty(self):
+        return self._dirty
+
+    def accepts_sprite_type(self, sprite_type):
+        return False
+
+    def vertex_stride(self):
+        return 8
+
+    def texture_stride(self):
+        return 8
+
+    def index_stride(self):
+        return 6
+
+    def color_stride(self):
+        return 4 * 3
+
+    def get_num_sprites(self):
+        return self._grid_w * self._grid_h
+
+    def update(self, sprite_id, last_mod_time):
+        raise ValueError("{} doesn't hold sprites".format(type(self).__name__))
+
+    def remove(self, sprite_id):
+        pass
+
+    def rebuild(self, sprite_info_lookup):
+        self._dirty = False  # everything gets written in place by set_cell
+
+    def render(self, engine):
+        if engine.supports_glyph_instancing():
+            self._render_instanced(engine)
+            return
+
+        engine.set_vertices_enabled(True)
+        engine.set_texture_coords_enabled(True)
+        engine.set_colors_enabled(True)
+
+        self._vertex_buffer.sync(self.vertices)
+        engine.set_vertices(None)
+        self._tex_coord_buffer.sync(self.tex_coords)
+        engine.set_texture_coords(None)
+        self._color_buffer.sync(self.colors)
+        engine.set_colors(None)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self._index_buffer.sync(self.indices)
+        index_type = GL_UNSIGNED_SHORT if self._index_type == numpy.uint16 else GL_UNSIGNED_INT
+        glDrawElements(GL_TRIANGLES, len(self.indices), index_type, None)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+        engine.set_vertices_enabled(False)
+        engine.set_texture_coords_enabled(False)
+        engine.set_colors_enabled(False)
+
+    def _render_instanced(self, engine):
+        engine.begin_glyph_instances(self._grid_w, self._origin, self._cell_size)
+        self._glyph_buffer.sync(self.glyphs)
+        engine.set_glyph_instances(None)
+        self._cell_color_buffer.sync(self.cell_colors)
+        engine.set_glyph_instance_colors(None)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        engine.draw_glyph_instances(self.get_num_sprites())
+        engine.end_glyph_instances()
+
+    def reset_buffers(self, context_lost):
+        for buf in (self._vertex_buffer, self._tex_coord_buffer, self._color_buffer, self._index_buffer,
+                    self._glyph_buffer, self._cell_color_buffer):
+            buf.reset(delete=not context_lost)
+
+    def __contains__(self, sprite_id):
+        return False
+
+    def __repr__(self):
+        return "{}({}, {}, {}x{})".format(type(self).__name__, self.get_layer_id(), self.get_layer_depth(),
+                                          self._grid_w, self._grid_h)
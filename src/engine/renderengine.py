@@ -3,6 +3,7 @@ from OpenGL.GLU import *
 
 import numpy
 import math
+import sys
 import re
 import traceback
 
@@ -99,8 +100,10 @@ def _get_best_render_engine(glsl_version):
 
     if major_vers <= 1 and minor_vers < 30:
         return RenderEngine120()
-    else:
+    elif (major_vers <= 1 and minor_vers < 40) or not bool(glVertexAttribDivisor):
         return RenderEngine130()
+    else:
+        return RenderEngine140()
 
 
 class _SpriteInfoBundle:
@@ -139,6 +142,9 @@ class RenderEngine:
         self.ordered_layers = list(self.layers.values())
         self.ordered_layers.sort(key=lambda x: x.get_layer_depth())
 
+    def get_layer(self, layer_id):
+        return self.layers[layer_id] if layer_id in self.layers else None
+
     def hide_layer(self, layer_id):
         self.hidden_layers[layer_id] = None
 
@@ -202,6 +208,9 @@ class RenderEngine:
         raise NotImplementedError()
 
     def set_vertices(self, data):
+        """
+            data: array of vertex positions, or None to read them from the currently bound GL_ARRAY_BUFFER.
+        """
         raise NotImplementedError()
 
     def set_texture_coords_enabled(self, val):
@@ -214,6 +223,35 @@ class RenderEngine:
         raise NotImplementedError()
 
     def set_colors(self, data):
+        """
+            data: array of uint8 rgb colors, or None to read them from the currently bound GL_ARRAY_BUFFER.
+        """
+        raise NotImplementedError()
+
+    def supports_glyph_instancing(self):
+        """whether the engine can draw a CharGridLayer as one instanced quad per cell."""
+        return False
+
+    def begin_glyph_instances(self, grid_w, origin, cell_size):
+        raise NotImplementedError()
+
+    def set_glyph_instances(self, data):
+        """
+            data: uint16 array of each cell's (tx1, ty1), or None to read them from the currently
+                  bound GL_ARRAY_BUFFER. blank cells have a tx1 of 0xFFFF.
+        """
+        raise NotImplementedError()
+
+    def set_glyph_instance_colors(self, data):
+        """
+            data: uint8 array of each cell's rgb color, or None to read them from the currently bound GL_ARRAY_BUFFER.
+        """
+        raise NotImplementedError()
+
+    def draw_glyph_instances(self, n):
+        raise NotImplementedError()
+
+    def end_glyph_instances(self):
         raise NotImplementedError()
 
     def get_shader(self):
@@ -237,8 +275,12 @@ class RenderEngine:
         """
            XXX on Windows, when pygame.display.set_mode is called, it seems to wipe away the active
            gl context, so we get around that by rebuilding the shader program and rebinding the texture...
+           everywhere else the context survives, so the old gl buffers still need to be deleted.
         """
+        context_lost = sys.platform in ("win32", "cygwin")
+
         self.shader.end()
+        self.release_shader_buffers(context_lost)
 
         self.shader = self.build_shader()
         self.shader.begin()
@@ -248,6 +290,13 @@ class RenderEngine:
         if img_data is not None:
             self.set_texture(img_data, w, h, tex_id=self.tex_id)
 
+        for layer in self.layers.values():
+            layer.reset_buffers(context_lost)
+
+    def release_shader_buffers(self, context_lost):
+        """forgets any gl buffers that setup_shader made, deleting them first unless the context is gone."""
+        pass
+
     def set_texture(self, img_data, width, height, tex_id=None):
         """
             img_data: image data in string RGBA format.
@@ -538,7 +587,8 @@ class RenderEngine130(RenderEngine):
         printOpenGLError()
 
     def set_colors(self, data):
-        glVertexAttribPointer(self._color_attrib_loc, 3, GL_FLOAT, GL_FALSE, 0, data)
+        # colors are stored as bytes, gl maps them back to [0, 1]
+        glVertexAttribPointer(self._color_attrib_loc, 3, GL_UNSIGNED_BYTE, GL_TRUE, 0, data)
         printOpenGLError()
 
 
@@ -592,3 +642,163 @@ class RenderEngine120(RenderEngine130):
             '''
         )
 
+
+class RenderEngine140(RenderEngine130):
+    """
+        Same as RenderEngine130, but CharGridLayers get drawn with instancing. Each cell is one
+        instance of a unit quad, and only needs its glyph's atlas position and its color.
+        The cell's position comes from gl_InstanceID, since the grid never changes shape.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.glyph_shader = None
+        self._glyph_uniform_locs = {}
+        self._corner_attrib_loc = None
+        self._glyph_attrib_loc = None
+        self._glyph_color_attrib_loc = None
+
+        self._unit_quad_buffer = None
+
+    def get_glsl_version(self):
+        return "140"
+
+    def release_shader_buffers(self, context_lost):
+        if self._unit_quad_buffer is not None and not context_lost:
+            glDeleteBuffers(1, [self._unit_quad_buffer])
+        self._unit_quad_buffer = None
+
+    def supports_glyph_instancing(self):
+        return True
+
+    def build_glyph_shader(self):
+        return Shader(
+            '''
+            #version 140
+            in vec2 corner;
+            in vec2 glyph;
+            in vec3 vColor;
+
+            uniform mat4 modelview;
+            uniform mat4 proj;
+
+            uniform vec2 origin;
+            uniform vec2 cellSize;
+            uniform int gridWidth;
+
+            out vec2 texCoord;
+            out vec3 color;
+
+            void main()
+            {
+                vec2 cell = vec2(gl_InstanceID % gridWidth, gl_InstanceID / gridWidth);
+                vec2 pos = origin + (cell + corner) * cellSize;
+                if (glyph.x >= 65535.0) {
+                    pos = origin;  // blank cell, squash it down to nothing
+                }
+                texCoord = vec2(glyph.x + corner.x * cellSize.x, glyph.y + (1.0 - corner.y) * cellSize.y);
+                color = vColor;
+                gl_Position = proj * modelview * vec4(pos.x, pos.y, 0.0, 1.0);
+            }
+            ''',
+            '''
+            #version 140
+            in vec2 texCoord;
+            in vec3 color;
+
+            uniform vec2 texSize;
+            uniform sampler2D tex0;
+
+            out vec4 fragColor;
+
+            void main(void) {
+                vec2 texPos = vec2(texCoord.x / texSize.x, texCoord.y / texSize.y);
+                vec4 tcolor = texture(tex0, texPos);
+
+                for (int i = 0; i < 3; i++) {
+                    if (tcolor[i] >= 0.99) {
+                        fragColor[i] = tcolor[i] * color[i];
+                    } else {
+                        fragColor[i] = tcolor[i] * color[i] * color[i];
+                    }
+                }
+
+                fragColor.w = tcolor.w;
+            }
+            '''
+        )
+
+    def setup_shader(self):
+        super().setup_shader()
+
+        self.glyph_shader = self.build_glyph_shader()
+        prog_id = self.glyph_shader.get_program()
+        self.glyph_shader.begin()
+
+        self._glyph_uniform_locs = {}
+        for name in ("modelview", "proj", "origin", "cellSize", "gridWidth", "texSize", "tex0"):
+            loc = glGetUniformLocation(prog_id, name)
+            self._assert_valid_var(name, loc)
+            self._glyph_uniform_locs[name] = loc
+        glUniform1i(self._glyph_uniform_locs["tex0"], 0)
+
+        self._corner_attrib_loc = glGetAttribLocation(prog_id, "corner")
+        self._assert_valid_var("corner", self._corner_attrib_loc)
+        self._glyph_attrib_loc = glGetAttribLocation(prog_id, "glyph")
+        self._assert_valid_var("glyph", self._glyph_attrib_loc)
+        self._glyph_color_attrib_loc = glGetAttribLocation(prog_id, "vColor")
+        self._assert_valid_var("vColor", self._glyph_color_attrib_loc)
+        printOpenGLError()
+
+        # the same 4 corners get used for every cell, in the same order as ImageSprite's vertices
+        self._unit_quad_buffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self._unit_quad_buffer)
+        corners = numpy.array([0, 0, 0, 1, 1, 1, 1, 0], dtype=numpy.float32)
+        glBufferData(GL_ARRAY_BUFFER, corners.nbytes, corners, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        printOpenGLError()
+
+        self.shader.begin()
+
+    def begin_glyph_instances(self, grid_w, origin, cell_size):
+        self.glyph_shader.begin()
+        locs = self._glyph_uniform_locs
+        glUniformMatrix4fv(locs["modelview"], 1, GL_TRUE, self._modelview_matrix)
+        glUniformMatrix4fv(locs["proj"], 1, GL_TRUE, self._proj_matrix)
+        glUniform2f(locs["origin"], float(origin[0]), float(origin[1]))
+        glUniform2f(locs["cellSize"], float(cell_size[0]), float(cell_size[1]))
+        glUniform1i(locs["gridWidth"], int(grid_w))
+        if self.raw_texture_data is not None:
+            glUniform2f(locs["texSize"], float(self.raw_texture_data[1]), float(self.raw_texture_data[2]))
+
+        glBindBuffer(GL_ARRAY_BUFFER, self._unit_quad_buffer)
+        glEnableVertexAttribArray(self._corner_attrib_loc)
+        glVertexAttribPointer(self._corner_attrib_loc, 2, GL_FLOAT, GL_FALSE, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        glEnableVertexAttribArray(self._glyph_attrib_loc)
+        glVertexAttribDivisor(self._glyph_attrib_loc, 1)
+        glEnableVertexAttribArray(self._glyph_color_attrib_loc)
+        glVertexAttribDivisor(self._glyph_color_attrib_loc, 1)
+        printOpenGLError()
+
+    def set_glyph_instances(self, data):
+        glVertexAttribPointer(self._glyph_attrib_loc, 2, GL_UNSIGNED_SHORT, GL_FALSE, 0, data)
+        printOpenGLError()
+
+    def set_glyph_instance_colors(self, data):
+        glVertexAttribPointer(self._glyph_color_attrib_loc, 3, GL_UNSIGNED_BYTE, GL_TRUE, 0, data)
+        printOpenGLError()
+
+    def draw_glyph_instances(self, n):
+        glDrawArraysInstanced(GL_TRIANGLE_FAN, 0, 4, n)
+        printOpenGLError()
+
+    def end_glyph_instances(self):
+        glVertexAttribDivisor(self._glyph_attrib_loc, 0)
+        glVertexAttribDivisor(self._glyph_color_attrib_loc, 0)
+        glDisableVertexAttribArray(self._corner_attrib_loc)
+        glDisableVertexAttribArray(self._glyph_attrib_loc)
+        glDisableVertexAttribArray(self._glyph_color_attrib_loc)
+        self.shader.begin()
+        printOpenGLError()
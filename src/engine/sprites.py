@@ -2,6 +2,8 @@
 import src.engine.globaltimer as globaltimer
 
 import math
+import functools
+import numpy
 
 from src.utils.util import Utils
 
@@ -16,6 +18,13 @@ def gen_unique_id():
     return UNIQUE_ID_CTR - 1
 
 
+# bounded, because lots of colors (e.g. hp-based fades) only ever get used once
+@functools.lru_cache(maxsize=1024)
+def color_to_bytes(rgb):
+    """returns: the (r, g, b) color as ints between 0 and 255, which is how layers store colors."""
+    return tuple(min(255, max(0, int(c * 255 + 0.5))) for c in rgb)
+
+
 class SpriteTypes:
     IMAGE = "IMAGE"
     TRIANGLE = "TRIANGLE"
@@ -119,7 +128,7 @@ class TriangleSprite(_Sprite):
         vertices[i * 6 + 5] = p3[1]
 
         if colors is not None:
-            rgb = self.color()
+            rgb = color_to_bytes(self.color())
             for j in range(0, 9):
                 colors[i * 9 + j] = rgb[j % 3]
 
@@ -265,7 +274,7 @@ class ImageSprite(_Sprite):
         vertices[i*8 + 7] = y
 
         if colors is not None:
-            rgb = self.color()
+            rgb = color_to_bytes(self.color())
             for j in range(0, 12):
                 colors[i * 12 + j] = rgb[j % 3]
 
@@ -302,6 +311,73 @@ class ImageSprite(_Sprite):
                 self.scale(), self.depth(), self.xflip(), self.color(), self.ratio(), self.uid())
 
 
+_QUAD_INDICES = numpy.array([0, 1, 2, 0, 2, 3], dtype=numpy.uint32)
+
+
+def write_image_quads(slots, xs, ys, ws, hs, tex_rects, xflips, rotations, rgbs, vertices, texts, colors, indices):
+    """
+        Batched version of ImageSprite.add_urself. Writes a bunch of quads into a layer's arrays at once.
+
+        slots: int array, the slot each quad is written to.
+        xs, ys, ws, hs: float arrays, the position and (unrotated) size of each quad.
+        tex_rects: (n, 4) array of each quad's texture coords (tx1, ty1, tx2, ty2).
+        xflips: bool array.
+        rotations: int array, the number of clockwise 90 degree rotations of each quad.
+        rgbs: (n, 3) uint8 array of colors, or None if the layer doesn't use color.
+    """
+    n = len(slots)
+    rotations = rotations % 4
+
+    odd = rotations % 2 == 1
+    ws, hs = numpy.where(odd, hs, ws), numpy.where(odd, ws, hs)
+    x2 = xs + ws
+    y2 = ys + hs
+    vertices.reshape(-1, 8)[slots] = numpy.stack([xs, ys, xs, y2, x2, y2, x2, ys], axis=1)
+
+    u1 = numpy.where(xflips, tex_rects[:, 2], tex_rects[:, 0])
+    u2 = numpy.where(xflips, tex_rects[:, 0], tex_rects[:, 2])
+    v1 = tex_rects[:, 1]
+    v2 = tex_rects[:, 3]
+    corners = numpy.stack([u1, v2, u1, v1, u2, v1, u2, v2], axis=1).reshape(n, 4, 2)
+
+    # rotating is just starting from a different corner
+    corner_order = (numpy.arange(4) + rotations[:, None]) % 4
+    texts.reshape(-1, 8)[slots] = corners[numpy.arange(n)[:, None], corner_order].reshape(n, 8)
+
+    if colors is not None:
+        colors.reshape(-1, 12)[slots] = numpy.tile(rgbs, 4)
+
+    indices.reshape(-1, 6)[slots] = slots[:, None] * 4 + _QUAD_INDICES
+
+
+def add_image_sprites(sprite_list, slots, vertices, texts, colors, indices):
+    """
+        Same as calling add_urself on each sprite, but faster when there's lots of them.
+        slots: the slot to write each sprite to.
+    """
+    params = []  # flat list, numpy converts these a lot faster than a list of tuples
+    for spr in sprite_list:
+        model = spr._model
+        if model is None:
+            params.extend((spr._x, spr._y, 0, 0, 0, 0, 0, 0, spr._xflip, spr._rotation))
+        else:
+            params.extend((spr._x, spr._y,
+                           model.w * spr._scale * spr._ratio[0], model.h * spr._scale * spr._ratio[1],
+                           model.tx1, model.ty1, model.tx2, model.ty2, spr._xflip, spr._rotation))
+    params = numpy.array(params, dtype=numpy.float64).reshape(-1, 10)
+
+    rgbs = None
+    if colors is not None:
+        rgbs = []
+        for spr in sprite_list:
+            rgbs.extend(color_to_bytes(spr._color))
+        rgbs = numpy.array(rgbs, dtype=numpy.uint8).reshape(-1, 3)
+
+    write_image_quads(numpy.asarray(slots, dtype=numpy.intp), params[:, 0], params[:, 1], params[:, 2], params[:, 3],
+                      params[:, 4:8], params[:, 8] != 0, params[:, 9].astype(numpy.intp), rgbs,
+                      vertices, texts, colors, indices)
+
+
 _CURRENT_ATLAS_SIZE = None  # XXX this is a mega hack, just look away please
 
 
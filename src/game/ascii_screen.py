@@ -1,20 +1,61 @@
+import functools
+
+import numpy
 
 import src.game.colors as colors
 import src.engine.sprites as sprites
 
 
+@functools.lru_cache(maxsize=1024)
+def pack_color(color):
+    """returns: the (r, g, b) color (floats between 0 and 1.0) as a 0xRRGGBB int."""
+    r, g, b = sprites.color_to_bytes(tuple(color))
+    return (r << 16) | (g << 8) | b
+
+
+@functools.lru_cache(maxsize=1024)
+def unpack_color(rgb):
+    """returns: the 0xRRGGBB int as an (r, g, b) tuple of floats between 0 and 1.0"""
+    return ((rgb >> 16) & 0xFF) / 255, ((rgb >> 8) & 0xFF) / 255, (rgb & 0xFF) / 255
+
+
 class AsciiScreen:
+    """
+        A grid of characters. Each cell holds a stack of (char, color) items, and item_at cycles
+        through the stack over time (that's how entities sharing a cell take turns being drawn).
+
+        Most cells only ever hold one item, so the top item of each cell lives in numpy planes
+        (code point, packed 0xRRGGBB color, stack size). Cells with more than one item also have
+        their whole stack in a small overflow dict.
+    """
 
     def __init__(self, w, h, bg=" ", bg_color=colors.WHITE, anim_period=30):
-        self._char_map = {}  # (x, y) -> list of (char, color)
         self._bg_char = bg
         self._bg_color = bg_color
         self._anim_period = anim_period
         self._w = w
         self._h = h
 
+        self._codes = numpy.zeros((h, w), dtype=numpy.int32)  # code point of each cell's first item
+        self._rgbs = numpy.zeros((h, w), dtype=numpy.int32)   # packed color of each cell's first item
+        self._counts = numpy.zeros((h, w), dtype=numpy.uint16)  # number of items in each cell
+
+        # flat views of the same memory, indexed by y * w + x. indexing numpy arrays one element
+        # at a time is slow, and add and item_at get called for nearly every cell on every frame.
+        self._codes_mv = memoryview(self._codes.reshape(-1))
+        self._rgbs_mv = memoryview(self._rgbs.reshape(-1))
+        self._counts_mv = memoryview(self._counts.reshape(-1))
+
+        self._overflow = {}  # (x, y) -> list of (char, color), for cells with more than one item
+
+        # what each cell resolved to the last time get_changed_cells was called
+        self._last_codes = numpy.full((h, w), -1, dtype=numpy.int32)
+        self._last_rgbs = numpy.full((h, w), -1, dtype=numpy.int32)
+
     def clear(self):
-        self._char_map.clear()
+        # the code and color planes don't need to be wiped, cells with a count of 0 are ignored
+        self._counts.fill(0)
+        self._overflow.clear()
 
     def w(self):
         return self._w
@@ -36,38 +77,149 @@ class AsciiScreen:
             return
         if color is None:
             color = self._bg_color
-        if not self.is_valid(xy):
+        x, y = xy
+        if not (0 <= x < self._w and 0 <= y < self._h):
             print("WARN: {} is OOB".format(xy))
             return
-        if xy not in self._char_map or replace:
-            self._char_map[xy] = [(char, color)]
+
+        idx = y * self._w + x
+        count = self._counts_mv[idx]
+        if count == 0 or replace:
+            self._codes_mv[idx] = ord(char)
+            self._rgbs_mv[idx] = pack_color(color)
+            self._counts_mv[idx] = 1
+            if count > 1:
+                del self._overflow[(x, y)]
         else:
-            self._char_map[xy].append((char, color))
+            if count == 1:
+                self._overflow[(x, y)] = [self._first_item(idx)]
+            self._overflow[(x, y)].append((char, color))
+            self._counts_mv[idx] = count + 1
+
+    def _first_item(self, idx):
+        return chr(self._codes_mv[idx]), unpack_color(self._rgbs_mv[idx])
 
     def add_text(self, xy, text, color=None, replace=False, ignore=""):
         if isinstance(text, sprites.TextBuilder):
-            color_lookup = lambda _i: text.colors[_i] if _i in text.colors else color
             raw_text = text.text
+            text_colors = text.colors
         else:
-            color_lookup = lambda _i: color
             raw_text = text
+            text_colors = None
 
-        pos = xy
-        i = 0
-        for c in raw_text:
-            color = color_lookup(i)
+        if color is None:
+            color = self._bg_color
+
+        x, y = xy
+        line = []
+        line_colors = []
+        for i in range(0, len(raw_text)):
+            c = raw_text[i]
+            if text_colors is not None and i in text_colors:
+                # uncolored characters keep the color of the last colored one
+                color = text_colors[i]
             if c == "\n":
-                pos = (xy[0], pos[1] + 1)
+                self._blit_row(x, y, line, line_colors, replace, ignore)
+                y += 1
+                line = []
+                line_colors = []
             else:
-                self.add(pos, c, color=color, replace=replace, ignore=ignore)
-                pos = (pos[0] + 1, pos[1])
-            i += 1
+                line.append(c)
+                line_colors.append(color)
+        self._blit_row(x, y, line, line_colors, replace, ignore)
+
+    def _blit_row(self, x, y, chars, line_colors, replace, ignore):
+        """writes a row of characters starting at (x, y). anything that doesn't fit on the screen is dropped."""
+        if len(chars) == 0:
+            return
+
+        if not (0 <= y < self.h()):
+            print("WARN: {} is OOB".format((x, y)))
+            return
+        start = max(0, -x)
+        end = min(len(chars), self.w() - x)
+        if start > 0 or end < len(chars):
+            print("WARN: {} is partially OOB".format((x, y)))
+        if start >= end:
+            return
+
+        x1 = x + start
+        x2 = x + end
+        if len(chars) < 32 or (not replace and self._counts[y, x1:x2].any()):
+            # short rows and rows that stack on top of existing items go one cell at a time
+            for i in range(start, end):
+                self.add((x + i, y), chars[i], color=line_colors[i], replace=replace, ignore=ignore)
+            return
+
+        codes = numpy.fromiter(map(ord, chars[start:end]), dtype=numpy.int32, count=end - start)
+        rgbs = numpy.fromiter(map(pack_color, line_colors[start:end]), dtype=numpy.int32, count=end - start)
+        if len(ignore) > 0:
+            mask = numpy.fromiter((c not in ignore for c in chars[start:end]), dtype=bool, count=end - start)
+            self._codes[y, x1:x2] = numpy.where(mask, codes, self._codes[y, x1:x2])
+            self._rgbs[y, x1:x2] = numpy.where(mask, rgbs, self._rgbs[y, x1:x2])
+            self._counts[y, x1:x2] = numpy.where(mask, 1, self._counts[y, x1:x2])
+        else:
+            mask = None
+            self._codes[y, x1:x2] = codes
+            self._rgbs[y, x1:x2] = rgbs
+            self._counts[y, x1:x2] = 1
+
+        if len(self._overflow) > 0:
+            for i in range(start, end):
+                if mask is None or mask[i - start]:
+                    self._overflow.pop((x + i, y), None)
+
+    def clear_cell(self, xy):
+        x, y = xy
+        if 0 <= x < self._w and 0 <= y < self._h:
+            idx = y * self._w + x
+            if self._counts_mv[idx] > 1:
+                del self._overflow[(x, y)]
+            self._counts_mv[idx] = 0
+
+    def blit(self, other, rect=None, dest=(0, 0)):
+        """copies every non-empty cell of another screen onto this one, whole stacks included, replacing
+           whatever was there. cell (x, y) of the other screen lands on (dest[0] + x, dest[1] + y).
+           rect: region of the other screen to copy, defaults to all of it."""
+        if rect is None:
+            rect = other.get_rect()
+        dx, dy = dest
+        x1 = max(0, rect[0], -dx)
+        y1 = max(0, rect[1], -dy)
+        x2 = min(other.w(), rect[0] + rect[2], self.w() - dx)
+        y2 = min(other.h(), rect[1] + rect[3], self.h() - dy)
+        if x1 >= x2 or y1 >= y2:
+            return
+
+        src_counts = other._counts[y1:y2, x1:x2]
+        mask = src_counts > 0
+        if not mask.any():
+            return
+
+        dst = (slice(y1 + dy, y2 + dy), slice(x1 + dx, x2 + dx))
+        self._codes[dst][mask] = other._codes[y1:y2, x1:x2][mask]
+        self._rgbs[dst][mask] = other._rgbs[y1:y2, x1:x2][mask]
+        self._counts[dst][mask] = src_counts[mask]
+
+        if len(self._overflow) > 0:
+            replaced = [(x, y) for (x, y) in self._overflow
+                        if x1 <= x - dx < x2 and y1 <= y - dy < y2 and mask[y - dy - y1, x - dx - x1]]
+            for xy in replaced:
+                del self._overflow[xy]
+        for (x, y), items in other._overflow.items():
+            if x1 <= x < x2 and y1 <= y < y2:
+                self._overflow[(x + dx, y + dy)] = list(items)
 
     def item_at(self, xy, tick=0, include_bg=True):
         """returns: (char, color) or None"""
-        if xy in self._char_map:
-            items = self._char_map[xy]
-            if len(items) > 0:
+        x, y = xy
+        if 0 <= x < self._w and 0 <= y < self._h:
+            idx = y * self._w + x
+            count = self._counts_mv[idx]
+            if count == 1:
+                return self._first_item(idx)
+            elif count > 1:
+                items = self._overflow[(x, y)]
                 idx = int(tick * len(items) / self._anim_period) % len(items)
                 return items[idx]
         if include_bg:
@@ -75,6 +227,31 @@ class AsciiScreen:
         else:
             return None
 
+    def resolve(self, tick=0):
+        """returns: (codes, rgbs), two (h, w) arrays of the code point and packed color that's
+                    showing in each cell at the given tick (i.e. what item_at would return)."""
+        empty = self._counts == 0
+        codes = numpy.where(empty, ord(self._bg_char), self._codes)
+        rgbs = numpy.where(empty, pack_color(self._bg_color), self._rgbs).astype(numpy.int32, copy=False)
+
+        for (x, y), items in self._overflow.items():
+            c, color = items[int(tick * len(items) / self._anim_period) % len(items)]
+            codes[y, x] = ord(c)
+            rgbs[y, x] = pack_color(color)
+
+        return codes, rgbs
+
+    def get_changed_cells(self, tick=0):
+        """returns: (xs, ys, codes, rgbs), arrays describing each cell that's showing something different
+                    than it was the last time this was called. the first call returns every cell."""
+        codes, rgbs = self.resolve(tick=tick)
+        changed = (codes != self._last_codes) | (rgbs != self._last_rgbs)
+
+        ys, xs = numpy.nonzero(changed)
+        self._last_codes = codes
+        self._last_rgbs = rgbs
+        return xs, ys, codes[ys, xs], rgbs[ys, xs]
+
     def get_all(self, tick=0, rect=None):
         """returns: TextBuilder"""
         if rect is None:
@@ -83,20 +260,32 @@ class AsciiScreen:
         for y in range(rect[1], rect[1] + rect[3]):
             if y > 0:
                 builder.add("\n")
-            for x in range(rect[0], rect[0] + rect[2]):
-                item = self.item_at((x, y), tick=tick)
-                c, color = item
-                builder.add(c, color=color)
-
+            self._add_row_to(builder, y, rect[0], rect[0] + rect[2], tick)
         return builder
 
     def get_row(self, y, tick=0):
         builder = sprites.TextBuilder()
-        for x in range(0, self.w()):
-            item = self.item_at((x, y), tick=tick)
-            builder.add(item[0], color=item[1])
+        self._add_row_to(builder, y, 0, self.w(), tick)
         return builder
 
+    def _add_row_to(self, builder, y, x1, x2, tick):
+        if not (0 <= y < self.h()):
+            for x in range(x1, x2):
+                builder.add(self._bg_char, color=self._bg_color)
+            return
+
+        lo = max(0, x1)
+        hi = min(self.w(), x2)
+        counts = self._counts[y, lo:hi].tolist()
+        codes = self._codes[y, lo:hi].tolist()
+        rgbs = self._rgbs[y, lo:hi].tolist()
+        for x in range(x1, x2):
+            if lo <= x < hi and counts[x - lo] == 1:
+                builder.add(chr(codes[x - lo]), color=unpack_color(rgbs[x - lo]))
+            else:
+                c, color = self.item_at((x, y), tick=tick)
+                builder.add(c, color=color)
+
     def pretty_print(self, tick=0, rect=None):
         my_str = self.get_all(tick=tick, rect=rect)
         print(my_str.text)
@@ -106,4 +295,3 @@ if __name__ == "__main__":
     asc = AsciiScreen(30, 20, bg="~")
     asc.add((10, 0), "☺")
     asc.pretty_print(tick=30)
-
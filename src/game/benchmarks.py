@@ -0,0 +1,198 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+
+import configs
+import src.game.headless as headless
+import src.game.pathfinding as pathfinding
+import src.game.units as units
+import src.game.worlds as worlds
+
+
+"""
+Canned scenarios for measuring how fast the simulation runs. Everything is seeded, so
+runs are comparable between versions. Results are printed as json.
+
+usage: python -m src.game.benchmarks [--ticks N] [--seed N] [--only name [name ...]] [--out file]
+"""
+
+
+def _make_hearts_sturdy(world):
+    # keep the game going so the load doesn't just vanish when the crystals die
+    for heart in world.all_hearts():
+        heart.set_stat_value(worlds.StatTypes.HP, 10 ** 9)
+        heart.set_hp(10 ** 9)
+
+
+def _start_at_wave(world, wave):
+    # the next wave is built from the controller's current level (and it's bumped afterwards)
+    controller = world.enemy_spawn_controller
+    controller.level = wave
+    assert controller.level == wave, "the next wave would be built at level {}".format(controller.level)
+
+
+def _place_randomly(world, provider, n):
+    placed = 0
+    for _ in range(0, n * 20):
+        if placed >= n:
+            break
+        ent = provider()
+        xy = world.rand_cell()
+        if world.can_build_at(ent, xy):
+            world.set_pos(ent, xy)
+            placed += 1
+    return placed
+
+
+_ATTACK_TOWERS = [lambda: units.GunTower(),
+                  lambda: units.GunTowerII(),
+                  lambda: units.ExplosionTower(),
+                  lambda: units.WeaknessTower(),
+                  lambda: units.SlowTower(),
+                  lambda: units.PoisonTower()]
+
+
+def _random_attack_tower():
+    return random.choice(_ATTACK_TOWERS)()
+
+
+def _setup_wave(wave, n_towers=30):
+    def _setup(world):
+        _make_hearts_sturdy(world)
+        _start_at_wave(world, wave)
+        _place_randomly(world, _random_attack_tower, n_towers)
+    return _setup
+
+
+def _setup_many_towers(world):
+    _make_hearts_sturdy(world)
+    _start_at_wave(world, 20)
+    _place_randomly(world, _random_attack_tower, 150)
+
+
+def _setup_maze(world):
+    _make_hearts_sturdy(world)
+    _start_at_wave(world, 20)
+
+    # columns of wall with a gap at alternating ends, between the spawn zones and the crystals
+    hearts_x = min(world.get_pos(h)[0] for h in world.all_hearts())
+    gap_at_top = True
+    for x in range(6, hearts_x - 1, 3):
+        for y in range(0, world.h()):
+            if (gap_at_top and y == 0) or (not gap_at_top and y == world.h() - 1):
+                continue
+            wall = units.WallTower()
+            if world.can_build_at(wall, (x, y)):
+                world.set_pos(wall, (x, y))
+        gap_at_top = not gap_at_top
+
+    _place_randomly(world, _random_attack_tower, 20)
+
+
+def _setup_bots(world):
+    _make_hearts_sturdy(world)
+    _start_at_wave(world, 10)
+
+    for provider in (lambda: units.BuildBotSpawner(),
+                     lambda: units.MineBotSpawner(),
+                     lambda: units.ScavengerBotSpawner()):
+        _place_randomly(world, provider, 5)
+
+    _place_randomly(world, lambda: units.RockTower(), 15)
+    _place_randomly(world, lambda: units.GoldOreTower(), 5)
+
+    # give the build-bots something to do
+    for _ in range(0, 20):
+        xy = world.rand_cell()
+        world.request_build_at(_random_attack_tower(), xy, 0, 0)
+
+
+SCENARIOS = {
+    "wave_30": _setup_wave(30),
+    "wave_60": _setup_wave(60),
+    "wave_100": _setup_wave(100),
+    "towers_150": _setup_many_towers,
+    "maze": _setup_maze,
+    "bots": _setup_bots,
+}
+
+
+def _percentile(sorted_vals, pcnt):
+    if len(sorted_vals) == 0:
+        return 0
+    idx = min(len(sorted_vals) - 1, int(pcnt / 100 * len(sorted_vals)))
+    return sorted_vals[idx]
+
+
+def run_scenario(name, n_ticks, seed=12345):
+    """returns: dict of results for the given scenario."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        scene = headless.create_scene(seed=seed)
+        SCENARIOS[name](scene._world)
+
+        pathfinding.reset_counters()
+        tick_times = []
+        start_time = time.perf_counter()
+        for _ in range(0, n_ticks):
+            t = time.perf_counter()
+            headless.step(scene)
+            tick_times.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start_time
+
+    world = scene._world
+    tick_times.sort()
+    return {
+        "ticks": n_ticks,
+        "seconds": round(elapsed, 4),
+        "ticks_per_sec": round(n_ticks / max(elapsed, 1e-9), 1),
+        "tick_ms": {
+            "p50": round(_percentile(tick_times, 50) * 1000, 4),
+            "p90": round(_percentile(tick_times, 90) * 1000, 4),
+            "p99": round(_percentile(tick_times, 99) * 1000, 4),
+            "max": round(tick_times[-1] * 1000, 4) if len(tick_times) > 0 else 0,
+        },
+        "pathfinding": pathfinding.get_counters(),
+        "end_state": {
+            "wave": world.get_wave(),
+            "kills": scene.kills,
+            "enemies": len(list(world.all_enemies())),
+            "robots": len(list(world.all_robots())),
+            "entities": len(world.positions),
+        },
+    }
+
+
+def run_all(n_ticks, seed=12345, only=None):
+    results = {
+        "version": configs.version,
+        "python": platform.python_version(),
+        "seed": seed,
+        "scenarios": {}
+    }
+    for name in SCENARIOS:
+        if only is None or name in only:
+            print("INFO: running {}...".format(name), file=sys.stderr)
+            results["scenarios"][name] = run_scenario(name, n_ticks, seed=seed)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="simulation throughput benchmarks")
+    parser.add_argument("--ticks", type=int, default=2000, help="ticks to run per scenario")
+    parser.add_argument("--seed", type=int, default=12345)
+    parser.add_argument("--only", nargs="+", choices=list(SCENARIOS.keys()), help="scenarios to run")
+    parser.add_argument("--out", help="file to write results to (default: stdout)")
+    args = parser.parse_args()
+
+    res = run_all(args.ticks, seed=args.seed, only=args.only)
+    res_json = json.dumps(res, indent=2)
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            f.write(res_json + "\n")
+    else:
+        print(res_json)
@@ -1,9 +1,6 @@
-import pygame
 import src.game.ascii_screen as ascii_screen
 import src.engine.sprites as sprites
 import src.game.const as const
-import src.engine.renderengine as renderengine
-import src.engine.spritesheets as spritesheets
 import src.game.colors as colors
 import random
 import math
@@ -14,18 +11,20 @@ import src.utils.textutils as textutils
 import src.game.worlds as worlds
 import src.utils.util as utils
 import src.game.units as units
+import src.game.panels as panels
 
 
 class GameState:
 
     def __init__(self):
         self.screen = ascii_screen.AsciiScreen(const.W, const.H, bg=" ", bg_color=colors.DARK_GRAY)
-        self.char_sprites = []
-        for x in range(0, const.W):
-            self.char_sprites.append([None] * const.H)
+
+        # pygame and GL stuff gets imported lazily so that the game logic can run headless
+        import src.engine.spritesheets as spritesheets
 
         # will be (9, 16) unless the sprite sheet is changed
         self.char_size = spritesheets.get_instance().get_sheet(spritesheets.DefaultFont.SHEET_ID).get_char("A").size()
+        self._char_models = {}  # code point -> ImageModel
 
         self.active_scene = TitleScene(self)
         self.next_scene = None
@@ -70,6 +69,7 @@ class GameState:
         self.active_scene.draw(self.screen)
 
     def to_ascii_coords(self, screen_pos):
+        import src.engine.renderengine as renderengine
         screen_size = renderengine.get_instance().get_game_size()
         root_xy = (screen_size[0] // 2 - (self.char_size[0] * const.W) // 2,
                    screen_size[1] // 2 - (self.char_size[1] * const.H) // 2)
@@ -78,30 +78,25 @@ class GameState:
         return (x, y)
 
     def _update_sprites(self):
+        import src.engine.renderengine as renderengine
         screen_size = renderengine.get_instance().get_game_size()
         root_xy = (screen_size[0] // 2 - (self.char_size[0] * const.W) // 2,
                    screen_size[1] // 2 - (self.char_size[1] * const.H) // 2)
-        font_lookup = spritesheets.get_instance().get_sheet(spritesheets.DefaultFont.SHEET_ID)
-        for y in range(0, const.H):
-            for x in range(0, const.W):
-                character, color = self.screen.item_at((x, y), tick=self.scene_ticks)
-                pos = (root_xy[0] + x * self.char_size[0],
-                       root_xy[1] + y * self.char_size[1])
-                if self.char_sprites[x][y] is None:
-                    self.char_sprites[x][y] = sprites.ImageSprite.new_sprite(const.TEXT_LAYER)
 
-                char_model = font_lookup.get_char(character)
+        char_grid = renderengine.get_instance().get_layer(const.TEXT_LAYER)
+        char_grid.set_origin(*root_xy)
 
-                self.char_sprites[x][y] = self.char_sprites[x][y].update(
-                    new_x=pos[0],
-                    new_y=pos[1],
-                    new_color=color,
-                    new_model=char_model)
+        # only the cells that look different from last frame need to be touched
+        xs, ys, codes, rgbs = self.screen.get_changed_cells(tick=self.scene_ticks)
+        for x, y, code, rgb in zip(xs.tolist(), ys.tolist(), codes.tolist(), rgbs.tolist()):
+            char_grid.set_cell(x, y, self._get_char_model(code), ascii_screen.unpack_color(rgb))
 
-    def all_sprites(self):
-        for y in range(0, len(self.char_sprites[0])):
-            for x in range(0, len(self.char_sprites)):
-                yield self.char_sprites[x][y]
+    def _get_char_model(self, code):
+        if code not in self._char_models:
+            import src.engine.spritesheets as spritesheets
+            font_lookup = spritesheets.get_instance().get_sheet(spritesheets.DefaultFont.SHEET_ID)
+            self._char_models[code] = font_lookup.get_char(chr(code))
+        return self._char_models[code]
 
 
 class Scene:
@@ -123,6 +118,7 @@ class TitleScene(Scene):
         self.ascii_buffer = [None] * (const.W * const.H)
 
     def update(self):
+        import pygame
         if inputs.get_instance().was_pressed(pygame.K_ESCAPE):
             print("Quitting game!")
             sys.exit()
@@ -183,6 +179,7 @@ class InstructionsScene(Scene):
         self.text_dims = self.instructions.get_dimensions()
 
     def update(self):
+        import pygame
         if inputs.get_instance().was_pressed(pygame.K_ESCAPE):
             self.state.set_next_scene(TitleScene(self.state))
         elif self.state.scene_ticks > 7 and (inputs.get_instance().was_anything_pressed()
@@ -226,29 +223,32 @@ class Button:
 
 class ShopButton(Button):
 
-    def __init__(self, tower_provider, scene, rect):
+    def __init__(self, tower_type, scene, rect):
         super().__init__(scene, rect)
-        self._tower_provider = tower_provider
-        self._tower_example = tower_provider()
+        self._archetype = worlds.get_archetype(tower_type)
+        self._tower_example = tower_type()  # stone costs depend on the world, so we need a real one
+        self._stone_cost = None  # (world, structure version, cost)
 
     def is_active(self):
         return True
 
     def get_gold_cost(self):
-        return self._tower_example.get_stat_value(worlds.StatTypes.BUY_PRICE)
+        return self._archetype.gold_cost
 
     def get_stone_cost(self, world):
-        return self._tower_example.get_stone_cost(world)
+        # counting up the towers is slow, and it only changes when towers or build markers come and go
+        version = world.get_structure_version()
+        if self._stone_cost is None or self._stone_cost[0] is not world or self._stone_cost[1] != version:
+            self._stone_cost = (world, version, self._tower_example.get_stone_cost(world))
+        return self._stone_cost[2]
 
     def can_afford(self):
         return self.scene.cash >= self.get_gold_cost() and self.scene.stones >= self.get_stone_cost(self.scene._world)
 
     def is_selected(self):
         current_sel = self.scene.selected_entity
-        my_sel = self.get_associated_entity()
         if current_sel is not None:
-            return (current_sel[0].get_name() == my_sel[0].get_name()
-                    and current_sel[1] == my_sel[1])
+            return current_sel[1] == "shop" and current_sel[0].get_name() == self._archetype.name
         else:
             return False
 
@@ -259,10 +259,10 @@ class ShopButton(Button):
             self.scene.set_selected(None)
 
     def draw(self, screen):
-        icon = self._tower_example.get_shop_icon()
-        color = self._tower_example.get_color()
-        gold_cost = self._tower_example.get_gold_cost()
-        stone_cost = self._tower_example.get_stone_cost(self.scene._world)
+        icon = self._archetype.shop_icon
+        color = self._archetype.color
+        gold_cost = self._archetype.gold_cost
+        stone_cost = self.get_stone_cost(self.scene._world)
         x = self.rect[0]
         w = self.rect[2]
         y = self.rect[1]
@@ -283,7 +283,7 @@ class ShopButton(Button):
         screen.add_text((x + w - len(price_tb.text), y), price_tb)
 
     def get_associated_entity(self):
-        return (self._tower_provider(), "shop")
+        return (self._tower_example, "shop")
 
 
 class PauseButton(Button):
@@ -406,6 +406,13 @@ class InGameScene(Scene):
         self.hovered_button = None
         self.buttons = self._build_buttons()
 
+        # the ui around the world barely ever changes, so it's only re-drawn when its inputs do
+        self._shop_panel = panels.Panel(self.shop_rect, self._draw_shop, self._get_shop_inputs)
+        self._info_panel = panels.Panel(self.info_rect, self._draw_info_text, self._get_info_inputs)
+        self._border_panel = panels.Panel([0, 0, const.W, const.H], self._draw_borders, self.get_border_color)
+        self._button_panel = panels.Panel([0, const.H - self.info_rect[3], const.W, 1],
+                                          self._draw_buttons, self._get_button_inputs)
+
     def get_mouse_pos_in_world(self):
         mouse_xy = self.state.get_mouse_pos()
         if mouse_xy is not None:
@@ -439,9 +446,9 @@ class InGameScene(Scene):
         x = self.shop_rect[0] + 1
         y = self.shop_rect[1] + 4
         w = self.shop_rect[2] - 2
-        for t_provider in units.get_towers_in_shop():
-            if t_provider is not None:
-                res.append(ShopButton(t_provider, self, [x, y, w, 1]))
+        for t_type in units.get_towers_in_shop():
+            if t_type is not None:
+                res.append(ShopButton(t_type, self, [x, y, w, 1]))
             y += 1
 
         y = const.H - self.info_rect[3]
@@ -503,11 +510,9 @@ class InGameScene(Scene):
         if xy is not None:
             for _ in self._world.all_entities_in_cell(xy, cond=lambda x: x.is_build_marker()):
                 return None
-        upgrades = ent.get_upgrades()
-        if len(upgrades) > 0:
-            upgrade = upgrades[0]
-            gold_cost = upgrade.get_gold_cost()
-            return gold_cost
+        upgrade_types = ent.get_upgrade_types()
+        if len(upgrade_types) > 0:
+            return worlds.get_archetype(upgrade_types[0]).gold_cost
         else:
             return None
 
@@ -552,6 +557,11 @@ class InGameScene(Scene):
                 pass
 
     def update(self):
+        self.handle_inputs()
+        self.update_world()
+
+    def handle_inputs(self):
+        import pygame
         if inputs.get_instance().was_pressed(pygame.K_SPACE):
             self.toggle_paused()
         if inputs.get_instance().was_pressed(pygame.K_TAB):
@@ -580,6 +590,8 @@ class InGameScene(Scene):
             # TODO play sound for hovering over a button
             pass
 
+    def update_world(self):
+        """advances the game by one frame, without looking at any inputs."""
         # hack becase game is too slow
         gs_to_n_updates = {0: 1, 1: 2, 2: 5}
         for _ in range(0, gs_to_n_updates[self.game_speed % 3]):
@@ -638,7 +650,8 @@ class InGameScene(Scene):
                         # we're currently trying to buy something, and we clicked in world
                         stone_cost = self.selected_entity[0].get_stone_cost(self._world)
                         gold_cost = self.selected_entity[0].get_gold_cost()
-                        if self._world.request_build_at(self.selected_entity[0], world_xy, gold_cost, stone_cost):
+                        to_build = self.selected_entity[0].get_archetype().create()  # shop entities are shared
+                        if self._world.request_build_at(to_build, world_xy, gold_cost, stone_cost):
                             self.cash -= gold_cost
                             self.stones -= stone_cost
                             self.set_selected(None)
@@ -698,6 +711,15 @@ class InGameScene(Scene):
         screen.add_text((x, y + 1), stones_text, color=colors.LIGHT_GRAY)
         screen.add_text((x-1, y + 2), "╟" + "─" * (w - 2) + "╢", color=self.get_border_color(), replace=True)
 
+        for b in self.buttons:
+            if isinstance(b, ShopButton):
+                b.draw(screen)
+
+    def _get_shop_inputs(self):
+        selected = self.selected_entity if self.selected_entity is not None and self.selected_entity[1] == "shop" else None
+        stone_costs = tuple(b.get_stone_cost(self._world) for b in self.buttons if isinstance(b, ShopButton))
+        return (self.cash, self.stones, selected, stone_costs, self.get_border_color())
+
     def get_wave(self):
         return self.wave
 
@@ -757,11 +779,44 @@ class InGameScene(Scene):
             ex = x + (w - len(esc_text)) // 2
             screen.add_text((ex, y + 3), esc_text, color=colors.DARK_GRAY, replace=True)
 
+    def _get_info_inputs(self):
+        ent_to_show = self.selected_entity
+        if ent_to_show is None:
+            ent_to_show = self.hovered_entity
+
+        if ent_to_show is None:
+            return (None, self.score, self._world.get_wave(), self.get_kills(),
+                    self._show_ranges, self._show_hp, self.is_game_over())
+        else:
+            # an entity's info text is its name, char and description, and only the char ever changes
+            hovered = self.hovered_button
+            if hovered is not None and not hovered.is_active():
+                hovered = None
+            return (ent_to_show, ent_to_show[0].get_char(), hovered, self.cash, self.is_game_over())
+
     def _draw_buttons(self, screen):
+        # the shop's buttons are drawn with the rest of the shop
         for b in self.buttons:
-            b.draw(screen)
+            if not isinstance(b, ShopButton):
+                b.draw(screen)
+
+    def _get_button_inputs(self):
+        actives = tuple(b.is_active() for b in self.buttons if not isinstance(b, ShopButton))
+        return (actives, self.hovered_button, self.is_paused(), self.game_speed,
+                self.selected_entity, self.can_upgrade_selected_tower(ignore_cost=False))
 
     def _draw_overlays(self, screen):
+        # ranges are drawn on top of the world, so the world's cached cells don't depend on the mouse
+        offs = (self._world_rect[0], self._world_rect[1])
+        if self._show_ranges:
+            towers = self._world.all_towers()
+        else:
+            mouse_xy = self.get_mouse_pos_in_world()
+            towers = self._world.all_entities_in_cell(mouse_xy) if mouse_xy is not None else []
+        for tower in towers:
+            if tower.is_attack_tower() and self.should_draw_tower_range(tower):
+                self._world.draw_tower_range(tower, screen, offs)
+
         if self.selected_entity is not None:
             if self.selected_entity[1] == "world":
                 # highlight object in
@@ -793,11 +848,11 @@ class InGameScene(Scene):
 
     def draw(self, screen):
         self._world.draw(screen, (1, 1), self)
-        self._draw_shop(screen)
-        self._draw_info_text(screen)
+        self._shop_panel.draw(screen)
+        self._info_panel.draw(screen)
         self._draw_overlays(screen)
-        self._draw_borders(screen)
-        self._draw_buttons(screen)
+        self._border_panel.draw(screen)
+        self._button_panel.draw(screen)
 
     def get_view_mode(self):
         if self._show_hp:
@@ -0,0 +1,82 @@
+import random
+import time
+import sys
+import io
+import contextlib
+
+import src.engine.globaltimer as globaltimer
+import src.game.gamestate as gamestate
+
+
+"""
+Runs the game logic without a window, GL context, or font sheet. Handy for soak tests
+and measuring how fast the simulation itself can go.
+
+usage: python -m src.game.headless [n_ticks] [seed]
+"""
+
+
+class HeadlessState:
+    """Stands in for gamestate.GameState. There's no screen and no mouse, just the clock."""
+
+    def __init__(self):
+        self.active_scene = None
+        self.next_scene = None
+
+        self.scene_ticks = 0
+        self.global_ticks = 0
+
+    def get_active_scene(self):
+        return self.active_scene
+
+    def set_next_scene(self, next):
+        pass  # headless runs stay in the same scene
+
+    def get_mouse_pos(self):
+        return None
+
+
+def create_scene(seed=None) -> gamestate.InGameScene:
+    """returns: a fresh InGameScene driven by a HeadlessState.
+       seed: seed for python's random module, so that runs are repeatable."""
+    if seed is not None:
+        random.seed(seed)
+    state = HeadlessState()
+    state.active_scene = gamestate.InGameScene(state)
+    return state.active_scene
+
+
+def step(scene):
+    """advances the scene by a single frame."""
+    scene.update_world()
+    scene.state.global_ticks += 1
+    scene.state.scene_ticks += 1
+    globaltimer.inc_tick_count()
+
+
+def run(scene, n_ticks, stop_on_game_over=True, quiet=True):
+    """advances the scene by up to n_ticks frames, as fast as possible.
+       returns: number of ticks that were actually run."""
+    out = io.StringIO() if quiet else sys.stdout
+    ticks = 0
+    with contextlib.redirect_stdout(out):
+        while ticks < n_ticks:
+            if stop_on_game_over and scene.is_game_over():
+                break
+            step(scene)
+            ticks += 1
+    return ticks
+
+
+if __name__ == "__main__":
+    n_ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 12345
+
+    scene = create_scene(seed=seed)
+    start_time = time.time()
+    ran = run(scene, n_ticks)
+    elapsed = time.time() - start_time
+
+    print("INFO: ran {} ticks in {:.3f}s ({:.1f} ticks/sec)".format(ran, elapsed, ran / max(elapsed, 1e-6)))
+    print("INFO: wave={}, kills={}, score={}, game_over={}".format(
+        scene._world.get_wave(), scene.kills, scene.score, scene.is_game_over()))
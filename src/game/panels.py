@@ -0,0 +1,38 @@
+import src.game.ascii_screen as ascii_screen
+
+
+class Panel:
+    """
+        A region of the screen that draws itself into its own AsciiScreen and keeps the result around.
+        It only gets re-drawn when its inputs change, the rest of the time the cached cells are just
+        copied into the real screen.
+
+        draw_func: screen -> None, draws the panel using the same coordinates as the real screen.
+        inputs_func: () -> hashable key of everything the panel's contents depend on.
+    """
+
+    def __init__(self, rect, draw_func, inputs_func):
+        self._rect = rect
+        self._draw_func = draw_func
+        self._inputs_func = inputs_func
+
+        self._screen = None
+        self._last_inputs = None
+        self._dirty = True
+
+    def get_rect(self):
+        return self._rect
+
+    def draw(self, screen):
+        inputs = self._inputs_func()
+        if self._screen is None or self._screen.size() != screen.size():
+            self._screen = ascii_screen.AsciiScreen(screen.w(), screen.h())
+            self._dirty = True
+
+        if self._dirty or inputs != self._last_inputs:
+            self._screen.clear()
+            self._draw_func(self._screen)
+            self._last_inputs = inputs
+            self._dirty = False
+
+        screen.blit(self._screen, rect=self._rect)
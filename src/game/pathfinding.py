@@ -0,0 +1,440 @@
+import collections
+import heapq
+import itertools
+import random
+from array import array
+
+import numpy
+
+import src.utils.util as util
+
+
+INFINITY = float("inf")
+
+_MAX_GOAL_DISTS = 16  # distance maps that each GridSearch keeps around, one per set of goals
+_MAX_CACHED_PATHS = 256
+_NUM_NEIGHBOR_ORDERS = 256  # length of the loop of tie-breaking orders each NeighborOrders cycles through
+
+
+# how much pathfinding work has been done, for benchmarking (see src/game/benchmarks.py)
+_COUNTERS = {}
+
+
+def count(name, n=1):
+    _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+
+
+def get_counters():
+    return dict(_COUNTERS)
+
+
+def reset_counters():
+    _COUNTERS.clear()
+
+
+# every order the 4 neighbors of a cell can be visited in. searches take one per cell (see
+# NeighborOrders) instead of building and shuffling a new list.
+_NEIGHBOR_ORDERS = list(itertools.permutations(range(0, 4)))
+
+_NEIGHBOR_TABLES = {}  # (w, h) -> (xys, neighbors), and ("cells", w, h) -> neighbor cells
+
+
+def get_neighbor_table(w, h):
+    """returns: (xys, neighbors) for a w x h grid of flat indices (y * w + x). xys[idx] is the cell's
+                (x, y) and neighbors[idx] is (right, down, left, up), -1 where that neighbor is off the grid.
+       the tables are built once per size and shared, so don't modify them."""
+    key = (w, h)
+    if key not in _NEIGHBOR_TABLES:
+        xys = [(idx % w, idx // w) for idx in range(0, w * h)]
+        neighbors = []
+        for (x, y) in xys:
+            neighbors.append(tuple(nx + ny * w if 0 <= nx < w and 0 <= ny < h else -1
+                                   for (nx, ny) in util.Utils.neighbors(x, y)))
+        _NEIGHBOR_TABLES[key] = (xys, neighbors)
+        count("neighbor_table_builds")
+    return _NEIGHBOR_TABLES[key]
+
+
+def get_neighbor_cells(w, h):
+    """returns: list of tuples, the (x, y) of each cell's in-bounds neighbors, indexed by flat index.
+       shared like get_neighbor_table's tables."""
+    key = ("cells", w, h)
+    if key not in _NEIGHBOR_TABLES:
+        xys, neighbors = get_neighbor_table(w, h)
+        _NEIGHBOR_TABLES[key] = [tuple(xys[n] for n in adj if n >= 0) for adj in neighbors]
+    return _NEIGHBOR_TABLES[key]
+
+
+class NeighborOrders:
+    """A fixed loop of neighbor orders, drawn at random up front. Ties get broken by whichever
+       neighbor comes first, so the inner loops never have to touch an rng or shuffle anything,
+       and two worlds seeded the same way break their ties the same way."""
+
+    def __init__(self, rng=None, size=_NUM_NEIGHBOR_ORDERS):
+        """rng: random.Random to draw the orders from, defaults to the random module."""
+        rng = rng if rng is not None else random
+        self._orders = [rng.choice(_NEIGHBOR_ORDERS) for _ in range(0, size)]
+        self._i = 0
+
+    def next(self):
+        """returns: the next order, a permutation of (0, 1, 2, 3) to index a neighbors tuple with."""
+        self._i += 1
+        if self._i >= len(self._orders):
+            self._i = 0
+        return self._orders[self._i]
+
+
+class GridSearch:
+    """Shortest paths over a w x h grid, for one agent at a time.
+
+       Cells are flat indices (y * w + x). The per-cell state of a search lives in arrays that
+       are reused from one search to the next (a search stamps the cells it touches instead of
+       clearing everything), so searching doesn't allocate anything per cell except heap entries.
+
+       If the caller knows the cheapest a step can ever be, the search is A*, using that times the
+       manhattan distance to the nearest goal as the heuristic. Otherwise it's uniform cost search."""
+
+    def __init__(self, w, h, orders=None):
+        """orders: NeighborOrders to break ties with, defaults to a new unseeded one."""
+        self._w = w
+        self._h = h
+        n = w * h
+
+        self._xys, self._neighbors = get_neighbor_table(w, h)
+        self._orders = orders if orders is not None else NeighborOrders()
+
+        self._g = array("d", [0.0]) * n
+        self._parent = array("l", [-1]) * n
+        self._costs = array("d", [0.0]) * n  # cost of entering each cell
+        self._priced = array("L", [0]) * n   # search number that last priced each cell
+        self._closed = array("L", [0]) * n   # search number that last expanded each cell
+        self._search_num = 0
+        self._heap = []
+
+        self._goal_dists = LRUCache(_MAX_GOAL_DISTS)  # frozenset of goal idxs -> list of manhattan distances to the nearest one
+
+    def idx(self, xy):
+        return xy[1] * self._w + xy[0]
+
+    def xy(self, idx):
+        return self._xys[idx]
+
+    def is_valid(self, xy):
+        return 0 <= xy[0] < self._w and 0 <= xy[1] < self._h
+
+    def get_goal_dists(self, goals):
+        """returns: list of the manhattan distance from each cell to the nearest of the given goal idxs."""
+        key = frozenset(goals)
+        dists = self._goal_dists.get(key)
+        if dists is None:
+            xs = numpy.arange(0, self._w * self._h) % self._w
+            ys = numpy.arange(0, self._w * self._h) // self._w
+            dists = numpy.full(self._w * self._h, self._w + self._h, dtype=numpy.int32)
+            for idx in key:
+                gx, gy = self._xys[idx]
+                numpy.minimum(dists, numpy.abs(xs - gx) + numpy.abs(ys - gy), out=dists)
+            dists = dists.tolist()
+            self._goal_dists.put(key, dists)
+            count("goal_dist_builds")
+
+        return dists
+
+    def search(self, start, goals, cost_func, min_step_cost=0):
+        """
+            start: (x, y) to search from. it isn't a goal even if it's in goals, the path has to go somewhere.
+            goals: set of idxs to search for.
+            cost_func: (x, y) -> cost of stepping into that cell, or None if it can't be entered.
+            min_step_cost: lower bound on what cost_func can return. if it's above 0, it's used to
+                           guide the search towards the goals (the paths are still optimal).
+            returns: list of cells leading from start (exclusive) to the cheapest goal (inclusive),
+                     or None if no goal can be reached.
+        """
+        count("searches")
+        if len(goals) == 0 or not self.is_valid(start):
+            return None
+
+        dists = self.get_goal_dists(goals) if min_step_cost > 0 else None
+
+        self._search_num += 1
+        stamp = self._search_num
+        g = self._g
+        parent = self._parent
+        costs = self._costs
+        priced = self._priced
+        closed = self._closed
+        neighbors = self._neighbors
+        next_order = self._orders.next
+        xys = self._xys
+        heap = self._heap
+        heap.clear()
+
+        start_idx = self.idx(start)
+        priced[start_idx] = stamp
+        costs[start_idx] = INFINITY  # nothing should step back into it
+        g[start_idx] = 0
+        parent[start_idx] = -1
+        heap.append((0, 0, 0, start_idx))
+
+        i = 1  # last tiebreaker
+        expanded = 0
+        while len(heap) > 0:
+            _, _, _, cur = heapq.heappop(heap)
+            if closed[cur] == stamp:
+                continue  # stale entry, it was already reached more cheaply
+            closed[cur] = stamp
+            expanded += 1
+
+            if cur in goals and cur != start_idx:
+                count("search_expansions", expanded)
+                res = []
+                while cur != start_idx:
+                    res.append(xys[cur])
+                    cur = parent[cur]
+                res.reverse()
+                return res
+
+            cur_g = g[cur]
+            adj = neighbors[cur]
+            for k in next_order():
+                n = adj[k]
+                if n < 0 or closed[n] == stamp:
+                    continue
+                if priced[n] != stamp:
+                    priced[n] = stamp
+                    cost = cost_func(xys[n])
+                    costs[n] = cost if cost is not None else INFINITY
+                    g[n] = INFINITY
+                cost = costs[n]
+                if cost == INFINITY:
+                    continue
+                new_g = cur_g + cost
+                if new_g < g[n]:
+                    g[n] = new_g
+                    parent[n] = cur
+                    f = new_g if dists is None else new_g + dists[n] * min_step_cost
+                    # among equally promising cells, the one that's furthest along goes first. on open
+                    # ground that skips most of the cells a plain A* would tie on.
+                    heapq.heappush(heap, (f, -new_g, i, n))
+                    i += 1
+
+        count("search_expansions", expanded)
+        return None
+
+
+class LRUCache:
+    """A dict that only keeps its max_size most recently used entries."""
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """returns: the value for the key (and marks it as used), or default if it isn't in here."""
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key]
+        return default
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+
+    def values(self):
+        return self._items.values()
+
+    def clear(self):
+        self._items.clear()
+
+
+class PathCache:
+    """Least-recently-used cache of search results. Everything in it gets thrown out whenever the
+       version it's used with changes (i.e. when the world's geometry does)."""
+
+    def __init__(self, max_size=_MAX_CACHED_PATHS):
+        self._version = None
+        self._paths = LRUCache(max_size)  # key -> list of cells, or None if there wasn't a path
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """returns: (True, path) if there's a path cached for the key, otherwise (False, None)."""
+        if version != self._version:
+            self._paths.clear()
+            self._version = version
+
+        if key in self._paths:
+            path = self._paths.get(key)
+            self.hits += 1
+            count("path_cache_hits")
+            return True, path
+        else:
+            self.misses += 1
+            count("path_cache_misses")
+            return False, None
+
+    def put(self, key, version, path):
+        if version != self._version:
+            self._paths.clear()
+            self._version = version
+
+        self._paths.put(key, path)
+
+
+class FlowField:
+    """The cost for an agent to reach the nearest goal cell from every cell in the grid.
+
+       It's computed with a single backwards search from the goals, so any number of agents
+       can share it. An agent just steps to whichever neighbor is cheapest to enter + finish from.
+
+       When cells change, the field is repaired incrementally (this is D* Lite / LPA* without a
+       start cell, so it keeps every cell consistent instead of just the ones on one path). Only
+       the cells whose cost-to-goal actually changed get touched."""
+
+    def __init__(self, w, h, goal_func, cost_func, orders=None):
+        """
+            goal_func: (x, y) -> whether the cell is a goal.
+            cost_func: (x, y) -> cost of entering that cell, or None if it can't be entered.
+            orders: NeighborOrders that paths break ties with, defaults to a new unseeded one.
+        """
+        self._w = w
+        self._h = h
+        self._goal_func = goal_func
+        self._cost_func = cost_func
+        self._xys, self._neighbors = get_neighbor_table(w, h)
+        self._orders = orders if orders is not None else NeighborOrders()
+
+        self._goals = set()
+        self._costs = [INFINITY] * (w * h)
+
+        self._g = [INFINITY] * (w * h)    # current cost-to-goal
+        self._rhs = [INFINITY] * (w * h)  # one-step lookahead of the cost-to-goal
+        self._queue = []                  # (key, idx) of inconsistent cells, may contain stale entries
+
+        self._pending = set()  # idxs of cells that changed since the last repair
+
+        count("flow_field_builds")
+        for idx in range(0, w * h):
+            self._read_cell(idx)
+        for idx in self._goals:
+            self._update_cell(idx)
+        self._compute()
+
+    def _idx(self, xy):
+        return xy[1] * self._w + xy[0]
+
+    def _xy(self, idx):
+        return self._xys[idx]
+
+    def _read_cell(self, idx):
+        xy = self._xy(idx)
+        if self._goal_func(xy):
+            self._goals.add(idx)
+        else:
+            self._goals.discard(idx)
+
+        cost = self._cost_func(xy)
+        self._costs[idx] = cost if cost is not None else INFINITY
+
+    def _update_cell(self, idx):
+        if idx in self._goals:
+            self._rhs[idx] = 0
+        else:
+            best = INFINITY
+            for n in self._neighbors[idx]:
+                if n < 0:
+                    continue
+                through_cost = self._costs[n] + self._g[n]
+                if through_cost < best:
+                    best = through_cost
+            self._rhs[idx] = best
+
+        if self._g[idx] != self._rhs[idx]:
+            heapq.heappush(self._queue, (min(self._g[idx], self._rhs[idx]), idx))
+
+    def _compute(self):
+        expanded = 0
+        while len(self._queue) > 0:
+            key, idx = heapq.heappop(self._queue)
+            g = self._g[idx]
+            rhs = self._rhs[idx]
+            if g == rhs or key != min(g, rhs):
+                continue  # stale entry
+            expanded += 1
+
+            if g > rhs:
+                # cell got cheaper, lock it in and let the neighbors know
+                self._g[idx] = rhs
+            else:
+                # cell got more expensive, forget it and let it (and its neighbors) find a new route
+                self._g[idx] = INFINITY
+                self._update_cell(idx)
+
+            for n in self._neighbors[idx]:
+                if n >= 0:
+                    self._update_cell(n)
+
+        count("flow_field_expansions", expanded)
+
+    def cell_changed(self, xy):
+        """Lets the field know that a cell's cost or goal-ness may have changed. The field gets
+           repaired lazily, the next time it's queried."""
+        self._pending.add(self._idx(xy))
+
+    def _repair(self):
+        if len(self._pending) == 0:
+            return
+
+        count("flow_field_repairs")
+        for idx in self._pending:
+            self._read_cell(idx)
+        for idx in self._pending:
+            self._update_cell(idx)
+            for n in self._neighbors[idx]:
+                if n >= 0:
+                    self._update_cell(n)  # their rhs depends on the cost of entering this cell
+        self._pending.clear()
+
+        self._compute()
+
+    def get_dist(self, xy):
+        self._repair()
+        return self._g[self._idx(xy)]
+
+    def path_from(self, xy):
+        """returns: list of cells leading from xy (exclusive) to the nearest goal (inclusive),
+                    or None if no goal is reachable."""
+        count("flow_field_paths")
+        self._repair()
+
+        idx = self._idx(xy)
+        if self._g[idx] == INFINITY:
+            return None
+
+        res = []
+        while idx not in self._goals:
+            best = None
+            best_cost = INFINITY
+            adj = self._neighbors[idx]
+            for k in self._orders.next():
+                n = adj[k]
+                if n < 0:
+                    continue
+                cost = self._costs[n] + self._g[n]
+                if cost < best_cost:
+                    best = n
+                    best_cost = cost
+            if best is None:
+                return None
+            res.append(self._xy(best))
+            idx = best
+
+        return res
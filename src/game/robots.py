@@ -1,6 +1,7 @@
 
 import src.game.gamestate as gamestate
 import src.engine.layers as layers
+import src.engine.spritesheets as spritesheets
 import src.game.const as const
 import src.engine.game as game
 
@@ -18,11 +19,11 @@ class RobotTowerDefense(game.Game):
         return []  # the only sheet we need is font.png, which is a default sheet
 
     def create_layers(self):
-        yield layers.ImageLayer(const.TEXT_LAYER, 0, sort_sprites=False, use_color=True)
+        char_size = spritesheets.get_instance().get_sheet(spritesheets.DefaultFont.SHEET_ID).get_char("A").size()
+        yield layers.CharGridLayer(const.TEXT_LAYER, 0, const.W, const.H, char_size)
 
     def update(self):
         self.gamestate.update()
 
     def all_sprites(self):
-        for spr in self.gamestate.all_sprites():
-            yield spr
\ No newline at end of file
+        return []  # the text layer gets written to directly, see GameState._update_sprites
\ No newline at end of file
@@ -4,7 +4,7 @@ import src.utils.util as util
 import configs
 import random
 import math
-import heapq
+import src.engine.globaltimer as globaltimer
 
 
 class Tower(worlds.Entity):
@@ -34,9 +34,13 @@ class Tower(worlds.Entity):
     def is_tower(self):
         return True
 
-    def get_upgrades(self):
+    def get_upgrade_types(self):
+        """returns: list of Tower classes this can be upgraded into."""
         return []
 
+    def get_upgrades(self):
+        return [upgrade_type() for upgrade_type in self.get_upgrade_types()]
+
 
 class HeartTower(Tower):
 
@@ -64,9 +68,9 @@ class HeartTower(Tower):
 
 class RobotSpawner(Tower):
 
-    def __init__(self, character, color, name, description, robot_producer):
+    def __init__(self, character, color, name, description, robot_type):
         super().__init__(character, color, name, description)
-        self.robot_producer = robot_producer
+        self.robot_type = robot_type
         self._my_robot = None
         self.build_countup = 0
         self.robots_produced = 0
@@ -80,7 +84,7 @@ class RobotSpawner(Tower):
         return super().get_shop_icon() + "/☻"
 
     def can_charge(self, entity):
-        return entity.get_name() == self.robot_producer().get_name()
+        return entity.get_name() == worlds.get_archetype(self.robot_type).name
 
     def is_spawner(self):
         return True
@@ -92,7 +96,7 @@ class RobotSpawner(Tower):
             self.build_countup += 1
             ticks_per_build = self.ticks_per_action()
             if self.build_countup >= ticks_per_build or self.robots_produced == 0:
-                self._my_robot = self.robot_producer()
+                self._my_robot = self.robot_type()
                 world.set_pos(self._my_robot, my_xy)
                 self.build_countup = 0
                 self.robots_produced += 1
@@ -109,7 +113,7 @@ class BuildBotSpawner(RobotSpawner):
 
     def __init__(self):
         super().__init__("B", colors.GREEN, "Build-Bot Factory",
-                         "A tower that creates Build-Bots.", lambda: BuildBot())
+                         "A tower that creates Build-Bots.", BuildBot)
 
     def get_shop_icon(self):
         return "Blder/☻"
@@ -126,7 +130,7 @@ class MineBotSpawner(RobotSpawner):
 
     def __init__(self):
         super().__init__("M", colors.MID_GRAY, "Mine-Bot Factory",
-                         "A tower that creates Mine-Bots.", lambda: MineBot())
+                         "A tower that creates Mine-Bots.", MineBot)
 
     def get_shop_icon(self):
         return "Miner/☻"
@@ -143,7 +147,7 @@ class ScavengerBotSpawner(RobotSpawner):
 
     def __init__(self):
         super().__init__("S", colors.YELLOW, "Scavenger-Bot Factory",
-                         "A tower that creates Scavenger-Bots.", lambda: ScavengerBot())
+                         "A tower that creates Scavenger-Bots.", ScavengerBot)
 
     def get_shop_icon(self):
         return "Scvgr/☻"
@@ -170,9 +174,7 @@ class Agent(worlds.Entity):
 
     def wander(self, world, state):
         xy = world.get_pos(self)
-        ns = [n for n in util.Utils.neighbors(xy[0], xy[1])]
-        random.shuffle(ns)
-        for n in ns:
+        for n in world.rand_neighbors(xy):
             if world.can_move_to(self, n):
                 world.set_pos(self, n)
                 return True
@@ -211,6 +213,9 @@ class Robot(Agent):
         if self.character == "☻":
             return "☺" if self.charge <= 0 else "☻"
 
+    def has_animated_look(self):
+        return True  # charge and carried items change how it looks
+
     def is_robot(self):
         return True
 
@@ -294,7 +299,7 @@ class BuildBot(Robot):
 
     def try_to_do_goal_action(self, world, state):
         xy = world.get_pos(self)
-        for n in util.Utils.rand_neighbors(xy):
+        for n in world.rand_neighbors(xy):
             for bm in world.all_entities_in_cell(n, cond=lambda e: e.is_build_marker()):
                 if bm.activate(world, state):
                     return True
@@ -337,7 +342,7 @@ class MineBot(Robot):
                 self.carrying_item = None
                 return True
 
-        for n in util.Utils.rand_neighbors(xy):
+        for n in world.rand_neighbors(xy):
             for ent in world.all_entities_in_cell(n, cond=lambda e: e.is_rock() and e.is_active()):
                 return ent.mine(world, state)
 
@@ -381,6 +386,8 @@ class ScavengerBot(Robot):
 
 class GoldIngot(worlds.Entity):
 
+    SHARED_BASE_STATS = False  # sell price depends on the value
+
     def __init__(self, value):
         self.value = value
         super().__init__("$", colors.DARK_YELLOW, "Gold Bar (${})".format(self.value),
@@ -413,11 +420,63 @@ class StoneItem(worlds.Entity):
 
 class Enemy(Agent):
 
+    SHARED_BASE_STATS = False  # they're randomly generated
+
     def __init__(self, character, color, base_stats, name, description):
         self._base_stats = base_stats
+
+        # while the enemy is in a world, its hot fields live in the world's EnemyStore
+        self._store = None
+        self._store_row = -1
+        self._hp = 0
+
         super().__init__(character, color, name, description)
         self.current_path = []  # stored in reverse order
 
+    @property
+    def hp(self):
+        if self._store is not None:
+            return int(self._store.hp[self._store_row])
+        return self._hp
+
+    @hp.setter
+    def hp(self, val):
+        if self._store is not None:
+            self._store.hp[self._store_row] = val
+        else:
+            self._hp = val
+
+    def get_stat_value(self, stat_type):
+        if self._store is not None:
+            col = self._store.stat_columns.get(stat_type.idx)
+            if col is not None:
+                return int(col[self._store_row])
+        return self._stats[stat_type.idx]
+
+    def set_stat_value(self, stat_type, val):
+        if self._store is not None:
+            col = self._store.stat_columns.get(stat_type.idx)
+            if col is not None:
+                col[self._store_row] = val
+                return
+        super().set_stat_value(stat_type, val)
+
+    def attach_to_store(self, store, row):
+        self._store = store
+        self._store_row = row
+
+    def detach_from_store(self):
+        store = self._store
+        row = self._store_row
+        self._hp = int(store.hp[row])
+        for idx in store.stat_columns:
+            self._stats[idx] = int(store.stat_columns[idx][row])
+        self._store = None
+        self._store_row = -1
+
+    def get_store_row(self):
+        return self._store_row
+
     def forget_path(self):
         self.current_path = []
 
@@ -431,35 +490,38 @@ class Enemy(Agent):
             else:
                 self.current_path = []  # path got interrupted?
         else:
-            heart_pts = [world.get_pos(h) for h in world.all_hearts()]
-            if len(heart_pts) > 0:
-                best_path = find_best_path_to(self, world, heart_pts,
-                                              or_adjacent_to=False,
-                                              action_provider=lambda xy: AttackAndMoveAction(xy))
+            if not world.is_game_over():
+                # every enemy with the same profile shares one flow field, so this is usually just a lookup
+                field = world.get_enemy_flow_field(self.get_pathing_profile())
+                best_path = field.path_from(world.get_pos(self))
                 if best_path is None:
                     print("WARN: failed to find path to crystals: {}".format(self))
                     self.wander(world, state)
                 else:
                     best_path.reverse()
-                    self.current_path = best_path
+                    self.current_path = [AttackAndMoveAction(xy) for xy in best_path]
             else:
                 self.wander(world, state)
 
+        # status effects and poison are handled by the world's EnemyStore, for all enemies at once
+
+    def animate_status_effects(self, weakened, slowed, poisoned):
         status_colors = []
-        if self.is_weakened():
+        if weakened:
             status_colors.append(colors.DARK_BLUE)
-            self.set_stat_value(worlds.StatTypes.WEAKENED, max(0, self.get_stat_value(worlds.StatTypes.WEAKENED) - 1))
-        if self.is_slowed():
+        if slowed:
             status_colors.append(colors.PURPLE)
-            self.set_stat_value(worlds.StatTypes.SLOWED, max(0, self.get_stat_value(worlds.StatTypes.SLOWED) - 1))
-        if self.is_poisoned():
+        if poisoned:
             status_colors.append(colors.DARK_PURPLE)
-            self.set_stat_value(worlds.StatTypes.POISONED, max(0, self.get_stat_value(worlds.StatTypes.POISONED) - 1))
-            self.take_damage_from(2, None)
 
         if len(status_colors) > 0:
             self.perturb_color(random.choice(status_colors), duration=30)
 
+    def get_pathing_profile(self):
+        return PathingProfile(self.get_stat_value(worlds.StatTypes.APS),
+                              self.get_stat_value(worlds.StatTypes.DAMAGE),
+                              self.get_stat_value(worlds.StatTypes.RAMPAGE))
+
     def get_base_stats(self):
         res = {}
         for s in self._base_stats:
@@ -497,6 +559,56 @@ class Enemy(Agent):
         return True
 
 
+class PathingProfile:
+    """The stats that determine how an enemy weighs its paths. Enemies that share a profile (e.g. all
+       the enemies in a wave) can share pathing data. Transient stuff like being slowed, weakened, or
+       rampage's bonus damage is ignored, otherwise every enemy would end up with its own profile.
+
+       This quacks enough like an Entity to be passed to AttackAndMoveAction.get_cost_at."""
+
+    def __init__(self, aps, damage, rampage):
+        self.aps = aps
+        self.damage = damage
+        self.rampage = rampage
+
+    def get_stat_value(self, stat_type):
+        if stat_type == worlds.StatTypes.APS:
+            return self.aps
+        elif stat_type == worlds.StatTypes.DAMAGE:
+            return self.damage
+        elif stat_type == worlds.StatTypes.RAMPAGE:
+            return self.rampage
+        else:
+            return 0
+
+    def ticks_per_action(self):
+        if self.aps <= 0:
+            return 999
+        else:
+            return configs.target_fps / self.aps
+
+    def calc_damage_against(self, other):
+        other_def = other.get_stat_value(worlds.StatTypes.ARMOR)
+        if other.is_weakened():
+            other_def = other_def // 2
+        return max(0, self.damage - other_def)
+
+    def _key(self):
+        return (self.aps, self.damage, self.rampage)
+
+    def __eq__(self, other):
+        if isinstance(other, PathingProfile):
+            return self._key() == other._key()
+        else:
+            return False
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return "PathingProfile(aps={}, damage={}, rampage={})".format(self.aps, self.damage, self.rampage)
+
+
 class EnemySpawnZone(worlds.Entity):
 
     def __init__(self):
@@ -514,9 +626,6 @@ class EnemySpawnZone(worlds.Entity):
         res[worlds.StatTypes.SOLIDITY] = 0
         return res
 
-    def act(self, world, state):
-        pass
-
 
 class RockTower(Tower):
 
@@ -541,6 +650,8 @@ class RockTower(Tower):
     def act(self, world, state):
         if self.deactivation_countdown > 0:
             self.deactivation_countdown -= 1
+            if self.deactivation_countdown == 0:
+                self.look_changed()
 
     def mine(self, world, state):
         if not self.is_active():
@@ -553,6 +664,7 @@ class RockTower(Tower):
                     n = random.choice(ns)
                     self.drop_resources_at(n, world, state)
                 self.deactivation_countdown = self.deactivation_period
+                self.look_changed()
             else:
                 pass  # TODO sound for failed mine
             return True
@@ -569,8 +681,8 @@ class RockTower(Tower):
         res[worlds.StatTypes.STONE_PRICE] = 20
         return res
 
-    def get_upgrades(self):
-        return [GoldOreTower()]
+    def get_upgrade_types(self):
+        return [GoldOreTower]
 
 
 class GoldOreTower(RockTower):
@@ -585,7 +697,7 @@ class GoldOreTower(RockTower):
     def get_base_color(self):
         return colors.DARK_YELLOW if self.is_active() else colors.VERY_DARK_YELLOW
 
-    def get_upgrades(self):
+    def get_upgrade_types(self):
         return []
 
 
@@ -607,8 +719,8 @@ class WallTower(Tower):
         res[worlds.StatTypes.ARMOR] = 5
         return res
 
-    def get_upgrades(self):
-        return [DoorTower()]
+    def get_upgrade_types(self):
+        return [DoorTower]
 
 
 class DoorTower(Tower):
@@ -673,7 +785,6 @@ class BuildMarker(worlds.Entity):
 class BuildNewMarker(BuildMarker):
     def __init__(self, target, gold_paid, stone_paid):
         super().__init__(target)
-        self.scene_ticks = 0
         self.gold_paid = gold_paid
         self.stone_paid = stone_paid
 
@@ -695,19 +806,18 @@ class BuildNewMarker(BuildMarker):
         state.stones += self.stone_paid
         # TODO play sound for undoing a build command
 
-    def update(self, world, state):
-        super().update(world, state)
-        self.scene_ticks = state.state.scene_ticks
-
     def get_marker_symbol(self):
         return "!"
 
     def get_char(self):
-        if (self.scene_ticks // (configs.target_fps // 3) % 2) == 0:
+        if (globaltimer.tick_count() // (configs.target_fps // 3) % 2) == 0:
             return self.target.get_char()
         else:
             return self.get_marker_symbol()
 
+    def has_animated_look(self):
+        return True
+
 
 class SellMarker(BuildMarker):
 
@@ -752,9 +862,7 @@ class AttackTower(Tower):
         super().__init__(character, color, name, desc)
 
     def get_enemies_in_range(self, world):
-        r = self.get_stat_value(worlds.StatTypes.RANGE)
-        xy = world.get_pos(self)
-        return [e for e in world.all_entities_in_range(xy, r, cond=lambda _e: _e.is_enemy())]
+        return world.all_enemies_in_range_of(self)
 
     def get_enemies_to_hit(self, world, scene):
         enemies = self.get_enemies_in_range(world)
@@ -813,8 +921,8 @@ class GunTower(AttackTower):
         res[worlds.StatTypes.SOLIDITY] = 1
         return res
 
-    def get_upgrades(self):
-        return [GunTowerII()]
+    def get_upgrade_types(self):
+        return [GunTowerII]
 
 
 class GunTowerII(AttackTower):
@@ -838,8 +946,8 @@ class GunTowerII(AttackTower):
         res[worlds.StatTypes.SOLIDITY] = 1
         return res
 
-    def get_upgrades(self):
-        return [GunTowerIII()]
+    def get_upgrade_types(self):
+        return [GunTowerIII]
 
 
 class GunTowerIII(AttackTower):
@@ -887,8 +995,8 @@ class WeaknessTower(AttackTower):
         res[worlds.StatTypes.WEAKNESS_ON_HIT] = 10
         return res
 
-    def get_upgrades(self):
-        return [WeaknessTower2()]
+    def get_upgrade_types(self):
+        return [WeaknessTower2]
 
 
 class WeaknessTower2(AttackTower):
@@ -914,8 +1022,8 @@ class WeaknessTower2(AttackTower):
         res[worlds.StatTypes.WEAKNESS_ON_HIT] = 15
         return res
 
-    def get_upgrades(self):
-        return [WeaknessTower3()]
+    def get_upgrade_types(self):
+        return [WeaknessTower3]
 
 
 class WeaknessTower3(AttackTower):
@@ -941,7 +1049,7 @@ class WeaknessTower3(AttackTower):
         res[worlds.StatTypes.WEAKNESS_ON_HIT] = 25
         return res
 
-    def get_upgrades(self):
+    def get_upgrade_types(self):
         return []
 
 
@@ -954,8 +1062,8 @@ class SlowTower(AttackTower):
     def get_shop_icon(self):
         return "Slow Twr"
 
-    def get_upgrades(self):
-        return [PoisonTower()]
+    def get_upgrade_types(self):
+        return [PoisonTower]
 
     def get_base_stats(self):
         res = super().get_base_stats()
@@ -996,8 +1104,8 @@ class PoisonTower(AttackTower):
         res[worlds.StatTypes.SLOWNESS_ON_HIT] = 5
         return res
 
-    def get_upgrades(self):
-        return [BlightTower()]
+    def get_upgrade_types(self):
+        return [BlightTower]
 
 
 class BlightTower(AttackTower):
@@ -1049,8 +1157,8 @@ class ExplosionTower(AttackTower):
         res[worlds.StatTypes.SOLIDITY] = 1
         return res
 
-    def get_upgrades(self):
-        return [ExplosionTowerII()]
+    def get_upgrade_types(self):
+        return [ExplosionTowerII]
 
 
 class ExplosionTowerII(AttackTower):
@@ -1078,8 +1186,8 @@ class ExplosionTowerII(AttackTower):
         res[worlds.StatTypes.SOLIDITY] = 1
         return res
 
-    def get_upgrades(self):
-        return [ExplosionTowerIII()]
+    def get_upgrade_types(self):
+        return [ExplosionTowerIII]
 
 
 class ExplosionTowerIII(AttackTower):
@@ -1289,10 +1397,6 @@ class Action:
     def __init__(self, xy):
         self.xy = xy
 
-        # used to help calculate action sequences
-        self.prev = None
-        self.prev_cost = 0
-
     def get_xy(self):
         return self.xy
 
@@ -1304,8 +1408,28 @@ class Action:
            Used for calculating sequences of actions."""
         return 0
 
-    def get_total_cost(self, entity, world):
-        return self.prev_cost + self.get_cost(entity, world)
+    @classmethod
+    def get_cost_at(cls, entity, world, xy):
+        """returns: cost of doing this kind of action at xy, or None if it isn't possible.
+           searches use this so they don't have to build an action for every cell they look at."""
+        action = cls(xy)
+        if action.is_possible(entity, world):
+            return action.get_cost(entity, world)
+        else:
+            return None
+
+    @classmethod
+    def get_min_cost(cls, entity):
+        """returns: lower bound on get_cost_at for the entity, anywhere. searches use it to head towards
+                    their goals. 0 means there isn't a useful one."""
+        return 0
+
+    @classmethod
+    def get_cost_fingerprint(cls, entity):
+        """returns: hashable of everything about the entity that get_cost_at depends on (besides the world's
+                    geometry), so that entities with the same fingerprint can share paths. None if the
+                    results shouldn't be shared."""
+        return None
 
     def is_possible(self, entity, world):
         return True
@@ -1331,6 +1455,21 @@ class MoveToAction(Action):
     def get_cost(self, entity, world):
         return entity.ticks_per_action()
 
+    @classmethod
+    def get_cost_at(cls, entity, world, xy):
+        if world.can_move_to(entity, xy):
+            return entity.ticks_per_action()
+        else:
+            return None
+
+    @classmethod
+    def get_min_cost(cls, entity):
+        return entity.ticks_per_action()  # every step at least involves moving
+
+    @classmethod
+    def get_cost_fingerprint(cls, entity):
+        return entity.is_robot(), entity.ticks_per_action()
+
     def is_possible(self, entity, world):
         return world.can_move_to(entity, self.xy)
 
@@ -1355,9 +1494,34 @@ class AttackAndMoveAction(MoveToAction):
         return "AttackAndMoveAction(xy={})".format(self.xy)
 
     def get_cost(self, entity, world):
+        return self.get_break_cost(entity, world, self.xy) + super().get_cost(entity, world)  # cost to move afterwards
+
+    @classmethod
+    def get_cost_at(cls, entity, world, xy):
+        if isinstance(entity, PathingProfile):
+            # every enemy with the profile is pricing the same cells, so the world keeps them in a grid
+            return int(world.get_break_costs(entity)[xy]) + entity.ticks_per_action()
+        else:
+            return cls.get_break_cost(entity, world, xy) + entity.ticks_per_action()
+
+    @classmethod
+    def get_cost_fingerprint(cls, entity):
+        if isinstance(entity, PathingProfile):
+            return entity
+        else:
+            # same as what calc_damage_against uses
+            dmg = entity.get_stat_value(worlds.StatTypes.DAMAGE)
+            if entity.is_weakened():
+                dmg = dmg // 2
+            dmg += entity.get_stat_value(worlds.StatTypes.BONUS_DAMAGE)
+            return entity.ticks_per_action(), dmg, entity.get_stat_value(worlds.StatTypes.RAMPAGE)
+
+    @staticmethod
+    def get_break_cost(entity, world, xy):
+        """returns: roughly how many ticks it'll take to break through everything solid in the cell."""
         ticks_per_action = entity.ticks_per_action()
         res = 0
-        for e in world.all_entities_in_cell(self.xy, cond=lambda e: e.get_solidity() != 0):
+        for e in world.all_entities_in_cell(xy, cond=lambda e: e.get_solidity() != 0):
             cur_hp = e.get_stat_value(worlds.StatTypes.HP)
             dmg = entity.calc_damage_against(e)
             ramp = entity.get_stat_value(worlds.StatTypes.RAMPAGE)
@@ -1377,7 +1541,7 @@ class AttackAndMoveAction(MoveToAction):
 
             res += int(math.ceil(x) * ticks_per_action * aggression_mult)
 
-        return res + super().get_cost(entity, world)  # cost to move afterwards
+        return res
 
     def is_possible(self, entity, world):
         return True
@@ -1401,76 +1565,59 @@ class AttackAndMoveAction(MoveToAction):
             return False
 
 
-def find_best_path_to(entity, world, endpoints, start=None, or_adjacent_to=False, action_provider=lambda xy: MoveToAction(xy)):
-    final_action = _find_best_path_helper(entity, world, endpoints, start=start, or_adjacent_to=or_adjacent_to,
-                                          action_provider=action_provider)
-
-    if final_action is None:
+def find_best_path_to(entity, world, endpoints, start=None, or_adjacent_to=False, action_type=MoveToAction):
+    """returns: list of actions (of the given type) leading the entity to the cheapest endpoint,
+                or None if there's no way to get to any of them."""
+    cells = find_best_cells_to(entity, world, endpoints, start=start, or_adjacent_to=or_adjacent_to,
+                               action_type=action_type)
+    if cells is None:
         return None
     else:
-        res = [final_action]
-        action = final_action.prev
-        while action is not None:
-            res.append(action)
-            action = action.prev
-        res.reverse()
-        return res
+        return [action_type(xy) for xy in cells]
 
 
-def _find_best_path_helper(entity, world, endpoints, start=None, or_adjacent_to=False, action_provider=lambda xy: MoveToAction(xy)):
-    if len(endpoints) == 0:
-        return None
-    endpoint_set = set(endpoints)
-    if or_adjacent_to:
-        for pt in endpoints:
-            for n in util.Utils.neighbors(pt[0], pt[1]):
-                endpoint_set.add(n)
-    endpoints = endpoint_set
+def find_best_cells_to(entity, world, endpoints, start=None, or_adjacent_to=False, action_type=MoveToAction):
+    """returns: list of cells leading the entity from start (exclusive) to the cheapest endpoint (inclusive),
+                or None if there's no way to get to any of them."""
+    search = world.get_grid_search()
+    goals = set()
+    for pt in endpoints:
+        if search.is_valid(pt):
+            goals.add(search.idx(pt))
+        if or_adjacent_to:
+            for n in world.neighbors(pt):
+                goals.add(search.idx(n))
+
     start_xy = start if start is not None else world.get_pos(entity)
-    seen_pts = set()
-    seen_pts.add(start_xy)
-
-    q = []
-    i = 0  # tiebreaker
-    for n in util.Utils.rand_neighbors(start_xy):
-        seen_pts.add(n)
-        move_action = action_provider(n)
-        if move_action.is_possible(entity, world):
-            item = (move_action.get_cost(entity, world), i, move_action)
-            heapq.heappush(q, item)
-            i += 1
-
-    while len(q) > 0:
-        cost, _, action = heapq.heappop(q)
-        if action.get_xy() in endpoints:
-            return action  # we did it
-        else:
-            for n in util.Utils.rand_neighbors(action.get_xy()):
-                if n not in seen_pts:
-                    seen_pts.add(n)
-                    move_action = action_provider(n)
-                    move_action.prev_cost = cost
-                    move_action.prev = action
-                    if move_action.is_possible(entity, world):
-                        new_item = (move_action.get_total_cost(entity, world), i, move_action)
-                        heapq.heappush(q, new_item)
-                        i += 1
 
-    return None  # no way to do it
+    fingerprint = action_type.get_cost_fingerprint(entity)
+    if fingerprint is not None:
+        # entities with the same stats going between the same places can share a path
+        key = (action_type, fingerprint, start_xy, frozenset(goals))
+        version = world.get_geometry_version()
+        cached, cells = world.get_path_cache().get(key, version)
+        if not cached:
+            cells = search.search(start_xy, goals, lambda xy: action_type.get_cost_at(entity, world, xy),
+                                  min_step_cost=action_type.get_min_cost(entity))
+            world.get_path_cache().put(key, version, cells)
+        return list(cells) if cells is not None else None
+    else:
+        return search.search(start_xy, goals, lambda xy: action_type.get_cost_at(entity, world, xy),
+                             min_step_cost=action_type.get_min_cost(entity))
 
 
 def get_towers_in_shop():
     return [
-        lambda: BuildBotSpawner(),
-        lambda: MineBotSpawner(),
-        lambda: ScavengerBotSpawner(),
+        BuildBotSpawner,
+        MineBotSpawner,
+        ScavengerBotSpawner,
         None,
-        lambda: GunTower(),
-        lambda: ExplosionTower(),
-        lambda: WeaknessTower(),
-        lambda: SlowTower(),
+        GunTower,
+        ExplosionTower,
+        WeaknessTower,
+        SlowTower,
         None,
-        lambda: WallTower(),
-        lambda: RockTower()
+        WallTower,
+        RockTower
     ]
 
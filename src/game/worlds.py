@@ -1,19 +1,42 @@
 import math
+import heapq
+import numpy
 import src.game.colors as colors
 import src.utils.util as util
 import configs
 import random
 import src.engine.sprites as sprites
+import src.engine.globaltimer as globaltimer
 import src.game.ascii_screen as ascii_screen
+import src.game.pathfinding as pathfinding
+
+
+_MAX_FLOW_FIELDS = 8  # one per enemy profile, and there's usually only one profile alive at a time
+_MAX_BREAK_COST_GRIDS = 8  # same deal
+_MAX_GEOMETRY_LOG = 1024  # geometry changes to remember, so stale break cost grids can catch up
+
+# bits of World._cell_flags. the low two bits are the cell's solidity.
+_SOLIDITY_BITS = 0x3
+_TOWER_BIT = 0x4
+_BUILD_MARKER_BIT = 0x8
+_SPAWN_ZONE_BIT = 0x10
 
 
 class World:
 
-    def __init__(self, w, h, spawn_controller):
+    def __init__(self, w, h, spawn_controller, seed=None):
+        """seed: seed for the world's own rng (tie-breaking and such), defaults to one drawn from the random module."""
         self.cells = []
         self._w = w
         self._h = h
 
+        self._rng = random.Random(seed if seed is not None else random.getrandbits(32))
+
+        # adjacency is the same for every world of this size, so it's only worked out once
+        self._xys, self._neighbor_idxs = pathfinding.get_neighbor_table(w, h)
+        self._neighbor_cells = pathfinding.get_neighbor_cells(w, h)
+        self._neighbor_orders = pathfinding.NeighborOrders(self._rng)
+
         # lots of data duplication here but we need the speed
         self.positions = {}  # entity -> xy
         self.cells = {}      # xy -> list of entities
@@ -31,6 +54,50 @@ class World:
         self.enemy_spawn_controller = spawn_controller
         self.refresh_enemy_paths = False
 
+        # entities only get touched when it's their turn to act
+        self._sim_tick = 0            # number of (unpaused) ticks that have been simulated
+        self._updating = False
+        self._action_queue = []       # (tick, seq, entity), may contain stale entries
+        self._next_action_at = {}     # entity -> (tick, seq) of its live entry in the queue
+        self._action_seq = 0
+
+        # enemies aren't in the action queue, their hot fields live in here instead
+        self._enemy_store = EnemyStore(numpy.random.RandomState(self._rng.getrandbits(32)))
+
+        # dense per-cell counts, kept in sync by set_pos / remove. indexed by [x, y] (or just [xy]).
+        self._solid_counts = numpy.zeros((w, h), dtype=numpy.int16)         # entities with solidity 1
+        self._door_counts = numpy.zeros((w, h), dtype=numpy.int16)          # entities with solidity 2
+        self._solidity = numpy.zeros((w, h), dtype=numpy.int8)              # 0 = air, 1 = wall, 2 = door
+        self._tower_counts = numpy.zeros((w, h), dtype=numpy.int16)
+        self._build_marker_counts = numpy.zeros((w, h), dtype=numpy.int16)
+        self._spawn_zone_counts = numpy.zeros((w, h), dtype=numpy.int16)
+        self._enemy_counts = numpy.zeros((w, h), dtype=numpy.int16)
+        self._grid_flags = {}  # entity -> (solidity, is_tower, is_build_marker, is_spawn_zone, is_enemy)
+
+        # the same info packed into one byte per cell, indexed by y * w + x. the numpy grids are for
+        # whole-grid work, reading them one cell at a time is slower than a plain list.
+        self._cell_flags = bytearray(w * h)
+
+        # which attack towers can reach each cell, and which enemies each attack tower can currently reach
+        self._coverage = {}        # xy -> list of attack towers in range of it
+        self._tower_cells = {}     # attack tower -> list of cells in its range
+        self._tower_targets = {}   # attack tower -> dict of enemies in range (dict just for ordering)
+
+        self._geometry_version = 0  # incremented whenever something solid is added or removed
+        self._structure_version = 0  # incremented whenever a tower or build marker is added or removed
+        self._enemy_flow_fields = pathfinding.LRUCache(_MAX_FLOW_FIELDS)  # PathingProfile -> FlowField
+        self._break_costs = pathfinding.LRUCache(_MAX_BREAK_COST_GRIDS)  # PathingProfile -> (geometry version, grid)
+        self._geometry_log = []       # cell that changed at each geometry version since _geometry_log_start
+        self._geometry_log_start = 0
+        self._grid_search = None
+        self._path_cache = pathfinding.PathCache()
+
+        # what the world looked like last time it was drawn, so only the cells that changed get re-drawn
+        self._screen = None                 # AsciiScreen, in world coordinates
+        self._screen_mode = None            # view mode it was drawn with
+        self._dirty_cells = set()           # cells that need to be re-drawn
+        self._animated = {}                 # entity -> tick its look stops changing (None = never)
+
     def w(self):
         return self._w
 
@@ -57,16 +124,51 @@ class World:
             return self.get_solidity(xy) == 0
 
     def get_solidity(self, xy):
-        if not self.is_valid(xy):
-            return 1
+        x, y = xy
+        if 0 <= x < self._w and 0 <= y < self._h:
+            return self._cell_flags[y * self._w + x] & _SOLIDITY_BITS
         else:
-            res = 0
-            for ent in self.all_entities_in_cell(xy):
-                if ent.get_solidity() == 1:
-                    res = 1
-                elif res != 1 and ent.get_solidity() == 2:
-                    res = 2
-            return res
+            return 1
+
+    def _add_to_grids(self, entity, xy):
+        flags = self._grid_flags.get(entity)
+        if flags is None:
+            flags = (entity.get_solidity(), entity.is_tower(), entity.is_build_marker(),
+                     entity.is_spawn_zone(), entity.is_enemy())
+            self._grid_flags[entity] = flags
+        self._adjust_grids(flags, xy, 1)
+
+    def _remove_from_grids(self, entity, xy):
+        flags = self._grid_flags.get(entity)
+        if flags is not None:
+            self._adjust_grids(flags, xy, -1)
+
+    def _adjust_grids(self, flags, xy, delta):
+        solidity, is_tower, is_marker, is_zone, is_enemy = flags
+        if solidity == 1:
+            self._solid_counts[xy] += delta
+        elif solidity == 2:
+            self._door_counts[xy] += delta
+        if solidity != 0:
+            if self._solid_counts[xy] > 0:
+                self._solidity[xy] = 1
+            elif self._door_counts[xy] > 0:
+                self._solidity[xy] = 2
+            else:
+                self._solidity[xy] = 0
+        if is_tower:
+            self._tower_counts[xy] += delta
+        if is_marker:
+            self._build_marker_counts[xy] += delta
+        if is_zone:
+            self._spawn_zone_counts[xy] += delta
+        if is_enemy:
+            self._enemy_counts[xy] += delta
+        if solidity != 0 or is_tower or is_marker or is_zone:
+            self._cell_flags[xy[1] * self._w + xy[0]] = (int(self._solidity[xy])
+                                                         | (_TOWER_BIT if self._tower_counts[xy] > 0 else 0)
+                                                         | (_BUILD_MARKER_BIT if self._build_marker_counts[xy] > 0 else 0)
+                                                         | (_SPAWN_ZONE_BIT if self._spawn_zone_counts[xy] > 0 else 0))
 
     def get_pos(self, entity):
         if entity in self.positions:
@@ -85,11 +187,41 @@ class World:
         self.cells[xy].append(entity)
 
     def set_pos(self, entity, xy):
+        old_pos = None
         if entity in self.positions:
             old_pos = self.positions[entity]
             self._remove_from_cell(entity, old_pos)
+            self._remove_from_grids(entity, old_pos)
+            self._remove_from_coverage(entity, old_pos)
         self.positions[entity] = xy
         self._add_to_cell(entity, xy)
+        self._add_to_grids(entity, xy)
+        self._add_to_coverage(entity, xy)
+
+        if old_pos is not None:
+            self._dirty_cells.add(old_pos)
+        self._dirty_cells.add(xy)
+
+        if entity.get_solidity() != 0:
+            if old_pos is not None:
+                self._cell_geometry_changed(old_pos)
+            self._cell_geometry_changed(xy)
+
+        if old_pos is None:
+            flags = self._grid_flags[entity]
+            if flags[1] or flags[2]:
+                self._structure_version += 1
+
+            entity.attach_to_world(self)
+            if entity.has_animated_look():
+                self._animated[entity] = None
+
+            # new entities act on the first tick they're around for.
+            # things that never do anything (walls, items, etc.) don't need to be scheduled at all
+            if entity.is_enemy():
+                self._enemy_store.add(entity, self._sim_tick + (1 if self._updating else 0))
+            elif type(entity).act is not Entity.act:
+                self._schedule_action(entity, 1 if self._updating else 0)
 
         for cache_key in self._caches:
             if self._caches[cache_key][0](entity):
@@ -100,24 +232,69 @@ class World:
             old_pos = self.positions[entity]
             del self.positions[entity]
             self._remove_from_cell(entity, old_pos)
+            self._remove_from_grids(entity, old_pos)
+            self._remove_from_coverage(entity, old_pos)
+            flags = self._grid_flags.pop(entity)
+            if flags[1] or flags[2]:
+                self._structure_version += 1
+
+            self._dirty_cells.add(old_pos)
+            entity.detach_from_world()
+            if entity in self._animated:
+                del self._animated[entity]
             if entity.is_tower():
                 self.refresh_enemy_paths = True
+            if entity.get_solidity() != 0:
+                self._cell_geometry_changed(old_pos)
+            if entity in self._next_action_at:
+                del self._next_action_at[entity]  # its queue entry is stale now
+            if entity.is_enemy():
+                self._enemy_store.remove(entity)
 
         for cache_key in self._caches:
             if entity in self._caches[cache_key][1]:
                 del self._caches[cache_key][1][entity]
 
+    def _add_to_coverage(self, entity, xy):
+        if entity.is_enemy():
+            if xy in self._coverage:
+                for tower in self._coverage[xy]:
+                    self._tower_targets[tower][entity] = None
+        elif entity.is_attack_tower():
+            cells = list(self.all_cells_in_range(xy, entity.get_stat_value(StatTypes.RANGE)))
+            targets = {}
+            for c in cells:
+                if c not in self._coverage:
+                    self._coverage[c] = []
+                self._coverage[c].append(entity)
+                if self._enemy_counts[c] > 0:
+                    for e in self.all_entities_in_cell(c, cond=lambda _e: _e.is_enemy()):
+                        targets[e] = None
+            self._tower_cells[entity] = cells
+            self._tower_targets[entity] = targets
+
+    def _remove_from_coverage(self, entity, xy):
+        if entity.is_enemy():
+            if xy in self._coverage:
+                for tower in self._coverage[xy]:
+                    self._tower_targets[tower].pop(entity, None)
+        elif entity in self._tower_cells:
+            for c in self._tower_cells[entity]:
+                self._coverage[c].remove(entity)
+            del self._tower_cells[entity]
+            del self._tower_targets[entity]
+
+    def all_enemies_in_range_of(self, tower):
+        """returns: list of enemies within range of an attack tower in the world."""
+        if tower in self._tower_targets:
+            return list(self._tower_targets[tower])
+        else:
+            return []
+
     def can_build_at(self, entity, xy):
-        for e in self.all_entities_in_cell(xy):
-            if e.get_solidity() != 0:
-                return False
-            elif e.is_build_marker():
-                return False
-            elif e.is_spawn_zone():
-                return False
-            elif e.is_tower():
-                return False
-        return True
+        x, y = xy
+        # nothing solid, no tower, no build marker, and no spawn zone
+        return 0 <= x < self._w and 0 <= y < self._h and self._cell_flags[y * self._w + x] == 0
 
     def request_build_at(self, entity, xy, gold_paid, stone_paid):
         if self.can_build_at(entity, xy):
@@ -193,42 +370,175 @@ class World:
 
     def empty_cells_adjacent_to(self, xys, empty_for=None):
         xys = set(util.Utils.listify(xys))
+        if empty_for is not None and empty_for.is_robot():
+            passable = (0, 2)
+        else:
+            passable = (0,)
         res = set()
         for xy in xys:
-            for n in util.Utils.rand_neighbors(xy):
-                if self.is_valid(n) and n not in xys and n not in res:
-                    if ((empty_for is None and self.get_solidity(n) == 0)
-                            or (empty_for is not None and self.can_move_to(empty_for, n))):
+            for n in self.neighbors(xy):
+                if n not in xys and n not in res:
+                    if (self._cell_flags[n[1] * self._w + n[0]] & _SOLIDITY_BITS) in passable:
                         res.add(n)
         return res
 
+    def get_geometry_version(self):
+        return self._geometry_version
+
+    def get_structure_version(self):
+        """returns: a number that changes whenever a tower or build marker is added or removed."""
+        return self._structure_version
+
+    def _cell_geometry_changed(self, xy):
+        self._geometry_version += 1
+        self._geometry_log.append(xy)
+        if len(self._geometry_log) > _MAX_GEOMETRY_LOG:
+            drop = len(self._geometry_log) // 2
+            del self._geometry_log[:drop]
+            self._geometry_log_start += drop
+        for field in self._enemy_flow_fields.values():
+            field.cell_changed(xy)
+
+    def _has_heart_at(self, xy):
+        for _ in self.all_entities_in_cell(xy, cond=lambda e: e.is_heart()):
+            return True
+        return False
+
+    def get_enemy_flow_field(self, profile):
+        """returns: FlowField towards the energy crystals for enemies with the given PathingProfile."""
+        field = self._enemy_flow_fields.get(profile)
+        if field is not None:
+            return field
+
+        import src.game.units as units
+        field = pathfinding.FlowField(self.w(), self.h(),
+                                      lambda xy: self._has_heart_at(xy),
+                                      lambda xy: units.AttackAndMoveAction.get_cost_at(profile, self, xy),
+                                      orders=self._neighbor_orders)
+        self._enemy_flow_fields.put(profile, field)
+        return field
+
+    def get_break_costs(self, profile):
+        """returns: (w, h) array of how many ticks it takes enemies with the given PathingProfile to break
+                    through everything solid in each cell. read-only please."""
+        import src.game.units as units
+        version = self._geometry_version
+        built_at, grid = self._break_costs.get(profile, (None, None))
+        if built_at == version:
+            return grid
+
+        if grid is None or built_at < self._geometry_log_start:
+            grid = numpy.zeros((self.w(), self.h()), dtype=numpy.int64)
+            xs, ys = numpy.nonzero(self._solidity)
+            cells = zip(xs.tolist(), ys.tolist())
+        else:
+            # just catch up on the cells that changed since it was last used
+            cells = set(self._geometry_log[built_at - self._geometry_log_start:])
+        for xy in cells:
+            grid[xy] = units.AttackAndMoveAction.get_break_cost(profile, self, xy)
+
+        self._break_costs.put(profile, (version, grid))
+        return grid
+
+    def get_grid_search(self):
+        """returns: the pathfinding.GridSearch that entities in this world share for their searches."""
+        if self._grid_search is None:
+            self._grid_search = pathfinding.GridSearch(self.w(), self.h(), orders=self._neighbor_orders)
+        return self._grid_search
+
+    def get_path_cache(self):
+        """returns: the pathfinding.PathCache that entities in this world share. it's cleared whenever
+                    the geometry version changes."""
+        return self._path_cache
+
+    def neighbors(self, xy):
+        """returns: tuple of the in-bounds cells next to xy, always in the same order."""
+        x, y = xy
+        if 0 <= x < self._w and 0 <= y < self._h:
+            return self._neighbor_cells[y * self._w + x]
+        else:
+            return ()
+
+    def rand_neighbors(self, xy):
+        """returns: list of the in-bounds cells next to xy, in an order picked by the world's rng."""
+        x, y = xy
+        if 0 <= x < self._w and 0 <= y < self._h:
+            adj = self._neighbor_idxs[y * self._w + x]
+            xys = self._xys
+            return [xys[adj[k]] for k in self._neighbor_orders.next() if adj[k] >= 0]
+        else:
+            return []
+
     def all_entities_adjacent_to(self, xy, cond=None):
-        for n in util.Utils.rand_neighbors(xy):
+        for n in self.rand_neighbors(xy):
             for e in self.all_entities_in_cell(n, cond=cond):
                 yield e
 
+    def _schedule_action(self, entity, delay):
+        tick = self._sim_tick + delay
+        self._action_seq += 1
+        self._next_action_at[entity] = (tick, self._action_seq)
+        heapq.heappush(self._action_queue, (tick, self._action_seq, entity))
+
     def update_all(self, scene):
-        to_update = [e for e in self.positions]
-        for ent in to_update:
-            # make sure it hasn't died during the action of another entity
-            if ent in self.positions:
-                if self.refresh_enemy_paths and ent.is_enemy():
-                    # force enemies to refresh if the geometry of the world has changed
-                    ent.forget_path()
+        if self.refresh_enemy_paths:
+            # force enemies to refresh if the geometry of the world has changed
+            for ent in self.all_enemies():
+                ent.forget_path()
+            self.refresh_enemy_paths = False
 
-                ent.update(self, scene)
+        if not scene.is_paused() and not scene.is_game_over() and not scene.should_skip_this_frame():
+            self._updating = True
+            q = self._action_queue
+            while len(q) > 0 and q[0][0] <= self._sim_tick:
+                tick, seq, ent = heapq.heappop(q)
+                if self._next_action_at.get(ent) != (tick, seq):
+                    continue  # it was removed (and maybe re-added) since this was queued
 
-        self.refresh_enemy_paths = False
+                ent.act(self, scene)
+
+                # make sure it wasn't removed during its own action
+                if ent in self._next_action_at and self._next_action_at[ent] == (tick, seq):
+                    self._schedule_action(ent, ent._calc_ticks_until_next_action() + 1)
+
+            self._update_enemies(scene)
+
+            self._updating = False
+            self._sim_tick += 1
 
         if not scene.is_paused():
-            to_remove = [ent for ent in self.positions if ent.is_dead()]
+            # only enemies and towers can take damage
+            to_remove = self._enemy_store.all_dead()
+            to_remove.extend(ent for ent in self.all_towers() if ent.is_dead())
             for ent in to_remove:
-                ent.on_death(self, scene)
-                self.remove(ent)
+                if ent in self.positions:
+                    ent.on_death(self, scene)
+                    self.remove(ent)
 
             if not scene.is_game_over():
                 self.enemy_spawn_controller.update(self)
 
+    def _update_enemies(self, scene):
+        store = self._enemy_store
+        due = store.all_due(self._sim_tick)
+        if len(due) == 0:
+            return
+
+        acted = []
+        for ent in due:
+            # it might've been removed (or removed and re-added) by someone else's action
+            if store.is_due(ent, self._sim_tick):
+                ent.act(self, scene)
+                if store.is_due(ent, self._sim_tick):
+                    acted.append(ent)
+
+        statuses = store.tick_status_effects(acted, self._sim_tick)
+        for ent, (weakened, slowed, poisoned) in zip(acted, statuses):
+            if poisoned:
+                ent.animate_damage_from(None)  # what take_damage_from would've done for the poison
+            if weakened or slowed or poisoned:
+                ent.animate_status_effects(weakened, slowed, poisoned)
+
     def all_entities_in_cell(self, xy, cond=None):
         if xy not in self.cells:
             return []
@@ -251,22 +561,59 @@ class World:
             for e in self.all_entities_in_cell(c, cond=cond):
                 yield e
 
+    def mark_dirty(self, xy):
+        """makes the given cell get re-drawn next frame."""
+        self._dirty_cells.add(xy)
+
+    def entity_look_changed(self, entity, until=None):
+        """called when an entity's char or color changes without it moving.
+           until: tick (of the global timer) that its look will keep changing until, if it's animating."""
+        xy = self.positions.get(entity)
+        if xy is not None:
+            self._dirty_cells.add(xy)
+            if until is not None:
+                if entity not in self._animated:
+                    self._animated[entity] = until
+                elif self._animated[entity] is not None:
+                    self._animated[entity] = max(self._animated[entity], until)
+
     def draw(self, screen, pos, state):
-        for x in range(0, self.w()):
-            for y in range(0, self.h()):
-                decs = []
-                drew_any = False
-                for ent in self.all_entities_in_cell((x, y)):
-                    if ent.is_decoration():
-                        decs.append(ent)
-                    else:
-                        drew_any = True
-                        ent.draw((pos[0] + x, pos[0] + y), screen, mode=state.get_view_mode())
-                        if ent.is_attack_tower() and state.should_draw_tower_range(ent):
-                            self.draw_tower_range(ent, screen, pos)
-                if not drew_any:
-                    for d in decs:
-                        d.draw((pos[0] + x, pos[0] + y), screen, mode=state.get_view_mode())
+        mode = state.get_view_mode()
+        if self._screen is None or self._screen_mode != mode:
+            self._screen = ascii_screen.AsciiScreen(self.w(), self.h())
+            self._screen_mode = mode
+            self._dirty_cells.update(self.cells.keys())
+
+        # entities that are mid-animation get re-drawn every frame
+        if len(self._animated) > 0:
+            tick = globaltimer.tick_count()
+            done = []
+            for ent, until in self._animated.items():
+                self._dirty_cells.add(self.positions[ent])
+                if until is not None and until < tick:
+                    done.append(ent)
+            for ent in done:
+                del self._animated[ent]
+
+        for xy in self._dirty_cells:
+            self._screen.clear_cell(xy)
+            self._draw_cell(xy, mode)
+        self._dirty_cells.clear()
+
+        screen.blit(self._screen, dest=pos)
+
+    def _draw_cell(self, xy, mode):
+        decs = []
+        drew_any = False
+        for ent in self.all_entities_in_cell(xy):
+            if ent.is_decoration():
+                decs.append(ent)
+            else:
+                drew_any = True
+                ent.draw(xy, self._screen, mode=mode)
+        if not drew_any:
+            for d in decs:
+                d.draw(xy, self._screen, mode=mode)
 
     def draw_tower_range(self, tower, screen, offs, xy=None):
         xy = self.get_pos(tower) if xy is None else xy
@@ -281,6 +628,119 @@ class World:
                 screen.add((offs[0] + n[0], offs[0] + n[1]), "░", color=color)
 
 
+class EnemyStore:
+    """Keeps the hot fields of every enemy in the world in numpy columns, so that the per-action
+       bookkeeping (status effects, poison, scheduling, death checks) can be done for all of them at once.
+       Enemies read and write through to their row while they're in here."""
+
+    # rows of the status block
+    WEAKENED = 0
+    SLOWED = 1
+    POISONED = 2
+
+    def __init__(self, rng):
+        self._rng = rng  # numpy RandomState, for the action timing variance
+        self._n = 0
+        self._entities = []
+
+        self._alloc(64)
+
+    def _columns(self):
+        return (self.hp, self.aps, self.armor, self.damage, self.status, self.next_tick)
+
+    def _alloc(self, cap):
+        self.hp = numpy.zeros(cap, dtype=numpy.int64)
+        self.aps = numpy.zeros(cap, dtype=numpy.float64)
+        self.armor = numpy.zeros(cap, dtype=numpy.int64)
+        self.damage = numpy.zeros(cap, dtype=numpy.int64)
+        self.status = numpy.zeros((3, cap), dtype=numpy.int64)  # turns left of weakness, slowness, poison
+        self.next_tick = numpy.zeros(cap, dtype=numpy.int64)
+
+        # stat idx -> column, for the stats that live in here
+        self.stat_columns = {StatTypes.ARMOR.idx: self.armor,
+                             StatTypes.DAMAGE.idx: self.damage,
+                             StatTypes.WEAKENED.idx: self.status[EnemyStore.WEAKENED],
+                             StatTypes.SLOWED.idx: self.status[EnemyStore.SLOWED],
+                             StatTypes.POISONED.idx: self.status[EnemyStore.POISONED]}
+
+    def __len__(self):
+        return self._n
+
+    def add(self, enemy, next_tick):
+        if self._n == len(self.hp):
+            old_cols = self._columns()
+            self._alloc(len(self.hp) * 2)
+            for col, old_col in zip(self._columns(), old_cols):
+                col[..., :self._n] = old_col[..., :self._n]
+        row = self._n
+        self.hp[row] = enemy.hp
+        self.aps[row] = enemy.get_stat_value(StatTypes.APS)
+        for idx in self.stat_columns:
+            self.stat_columns[idx][row] = enemy.get_stat_value(ALL_STAT_TYPES[idx])
+        self.next_tick[row] = next_tick
+
+        self._entities.append(enemy)
+        self._n += 1
+        enemy.attach_to_store(self, row)
+
+    def remove(self, enemy):
+        row = enemy.get_store_row()
+        if row < 0:
+            return
+        enemy.detach_from_store()  # copies its values back out
+
+        last = self._n - 1
+        if row != last:
+            # fill the hole with the last row
+            for col in self._columns():
+                col[..., row] = col[..., last]
+            moved = self._entities[last]
+            self._entities[row] = moved
+            moved.attach_to_store(self, row)
+        self._entities.pop()
+        self._n -= 1
+
+    def is_due(self, enemy, tick):
+        row = enemy.get_store_row()
+        return row >= 0 and self.next_tick[row] <= tick
+
+    def all_due(self, tick):
+        rows = numpy.flatnonzero(self.next_tick[:self._n] <= tick)
+        return [self._entities[r] for r in rows]
+
+    def all_dead(self):
+        rows = numpy.flatnonzero(self.hp[:self._n] <= 0)
+        return [self._entities[r] for r in rows]
+
+    def tick_status_effects(self, enemies, tick):
+        """wears down the status effects of enemies that just acted, applies poison, and decides when
+           they'll act next.
+           returns: list of (weakened, slowed, poisoned) for each enemy, from before they wore down.
+                    enemies that aren't in the store anymore are skipped and get all Falses."""
+        all_rows = numpy.fromiter((e.get_store_row() for e in enemies), dtype=numpy.int64, count=len(enemies))
+        in_store = all_rows >= 0
+        rows = all_rows[in_store]  # -1 would wrap around to the last row
+
+        status = self.status[:, rows]
+        had_status = status > 0
+        self.status[:, rows] = status - had_status
+
+        poisoned = had_status[EnemyStore.POISONED]
+        self.hp[rows] = numpy.maximum(0, self.hp[rows] - 2 * poisoned)
+
+        # same as Entity._calc_ticks_until_next_action
+        aps = self.aps[rows] * numpy.where(status[EnemyStore.SLOWED] > 1, 0.666, 1)
+        variance = 0.1
+        rand = self._rng.random_sample(len(rows))
+        delay = numpy.round(configs.target_fps / numpy.maximum(aps, 1e-6) * (1 + (rand - 0.5) * variance))
+        delay[aps <= 0] = 999
+        self.next_tick[rows] = tick + 1 + delay.astype(numpy.int64)
+
+        res = numpy.zeros((len(enemies), 3), dtype=bool)
+        res[in_store] = had_status.T
+        return res.tolist()
+
+
 _ENTITY_ID_COUNTER = 0
 
 
@@ -305,19 +765,22 @@ class StatType:
         self.desc_maker = desc_maker
         self.color = color
         self.default_val = default_val
+        self.idx = len(ALL_STAT_TYPES)  # slot in every entity's stat table
         ALL_STAT_TYPES.append(self)
 
     def __repr__(self):
         return self.name
 
     def __eq__(self, other):
-        if isinstance(other, StatType):
+        if self is other:
+            return True
+        elif isinstance(other, StatType):
             return self.name == other.name
         else:
             return False
 
     def __hash__(self):
-        return hash(self.name)
+        return self.idx
 
     def to_string(self, value) -> sprites.TextBuilder:
         tb = sprites.TextBuilder()
@@ -379,26 +842,41 @@ def make_stats(max_hp=None, actions_per_sec=None, damage=None, sell_price=None,
     return res
 
 
+def _stat_table_from_dict(stats):
+    res = [0] * len(ALL_STAT_TYPES)
+    for stat_type in stats:
+        res[stat_type.idx] = stats[stat_type]
+    return res
+
+
+_SHARED_STAT_TABLES = {}  # entity type -> stat table that all its instances start out sharing
+
+
 class Entity:
 
+    # whether get_base_stats() gives the same thing for every instance of the class. if it does,
+    # instances share one stat table until they change a stat (then they get their own copy).
+    SHARED_BASE_STATS = True
+
     def __init__(self, character, color, name, description):
         self.character = character
         self.base_color = color
 
-        self.stats = self.get_base_stats()
-        self._ticks_until_next_action = -1
+        self._stats = self._get_initial_stat_table()
+        self._owns_stats = not self.SHARED_BASE_STATS
 
         self.name = name
         self.description = description
 
         self.perturbed_color = None
-        self.perturbed_countdown = 0
+        self.perturbed_at = 0
         self.perturbed_duration = 20
 
         self.hp = self.get_stat_value(StatTypes.HP)
         self.charge = self.get_stat_value(StatTypes.MAX_CHARGE)
 
         self._id = _next_id()
+        self._world = None  # set while it's in a world, so it can tell the world when it needs to be re-drawn
 
     def get_info_text(self, w, in_world=True):
         tb = sprites.TextBuilder()
@@ -412,14 +890,23 @@ class Entity:
             res[stat_type] = stat_type.default_val
         return res
 
-    def get_stat_value(self, stat_type):
-        if stat_type in self.stats:
-            return self.stats[stat_type]
+    def _get_initial_stat_table(self):
+        if self.SHARED_BASE_STATS:
+            entity_type = type(self)
+            if entity_type not in _SHARED_STAT_TABLES:
+                _SHARED_STAT_TABLES[entity_type] = tuple(_stat_table_from_dict(self.get_base_stats()))
+            return _SHARED_STAT_TABLES[entity_type]
         else:
-            return 0
+            return _stat_table_from_dict(self.get_base_stats())
+
+    def get_stat_value(self, stat_type):
+        return self._stats[stat_type.idx]
 
     def set_stat_value(self, stat_type, val):
-        self.stats[stat_type] = val
+        if not self._owns_stats:
+            self._stats = list(self._stats)
+            self._owns_stats = True
+        self._stats[stat_type.idx] = val
 
     def ticks_per_action(self):
         aps = self.get_stat_value(StatTypes.APS) * (0.666 if self.is_slowed() else 1)
@@ -460,16 +947,35 @@ class Entity:
             else:
                 return util.Utils.linear_interp(lower, mid, pcnt / 0.5)
         else:
-            if self.perturbed_countdown <= 0 or self.perturbed_color is None:
+            perturbed_countdown = self.perturbed_duration - (globaltimer.tick_count() - self.perturbed_at)
+            if perturbed_countdown <= 0 or self.perturbed_color is None:
                 return self.get_base_color()
             else:
-                a = util.Utils.bound(self.perturbed_countdown / self.perturbed_duration, 0, 1)
+                a = util.Utils.bound(perturbed_countdown / self.perturbed_duration, 0, 1)
                 return util.Utils.linear_interp(self.get_base_color(), self.perturbed_color, a)
 
     def perturb_color(self, new_color, duration):
         self.perturbed_color = new_color
-        self.perturbed_countdown = duration
+        self.perturbed_at = globaltimer.tick_count()
         self.perturbed_duration = duration
+        if self._world is not None:
+            self._world.entity_look_changed(self, until=self.perturbed_at + duration)
+
+    def attach_to_world(self, world):
+        self._world = world
+
+    def detach_from_world(self):
+        self._world = None
+
+    def look_changed(self):
+        """call when something that affects the entity's char or color changes, so it gets re-drawn."""
+        if self._world is not None:
+            self._world.entity_look_changed(self)
+
+    def has_animated_look(self):
+        """returns: whether the entity's char or color can change on its own, in ways that don't go through
+                    look_changed. those get re-drawn every frame."""
+        return False
 
     def calc_damage_against(self, other):
         my_dmg = self.get_stat_value(StatTypes.DAMAGE)
@@ -503,7 +1009,8 @@ class Entity:
             # TODO noise for status effects
 
         ramp = self.get_stat_value(StatTypes.RAMPAGE)
-        self.stats[StatTypes.BONUS_DAMAGE] += ramp
+        if ramp != 0:
+            self.set_stat_value(StatTypes.BONUS_DAMAGE, self.get_stat_value(StatTypes.BONUS_DAMAGE) + ramp)
 
     def take_damage_from(self, damage, other):
         self.set_hp(self.get_hp() - damage)
@@ -556,7 +1063,10 @@ class Entity:
         self.charge = min(self.get_max_charge(), self.charge + val)
 
     def set_hp(self, new_hp):
+        old_hp = self.hp
         self.hp = util.Utils.bound(new_hp, 0, self.get_max_hp())
+        if self.hp != old_hp:
+            self.look_changed()  # towers get darker as they take damage, and there's the hp view
 
     def get_solidity(self):
         return self.get_stat_value(StatTypes.SOLIDITY)
@@ -601,17 +1111,6 @@ class Entity:
     def is_build_marker(self):
         return False
 
-    def update(self, world, state):
-        if self.perturbed_countdown > 0:
-            self.perturbed_countdown -= 1
-
-        if not state.is_paused() and not state.is_game_over() and not state.should_skip_this_frame():
-            if self._ticks_until_next_action <= 0:
-                self.act(world, state)
-                self._ticks_until_next_action = self._calc_ticks_until_next_action()
-            else:
-                self._ticks_until_next_action -= 1
-
     def _calc_ticks_until_next_action(self):
         aps = self.get_stat_value(StatTypes.APS) * (0.666 if self.is_slowed() else 1)
         if aps <= 0:
@@ -622,6 +1121,7 @@ class Entity:
             return round(fps / aps * (1 + (random.random() - 0.5) * variance))
 
     def act(self, world, state):
+        """called by the world whenever it's this entity's turn to do something."""
         pass
 
     def draw(self, xy, screen: ascii_screen.AsciiScreen, mode=None):
@@ -629,6 +1129,9 @@ class Entity:
         color = self.get_color(mode if mode is not None else ViewModes.NORMAL)
         screen.add(xy, character, color=color)
 
+    def get_archetype(self):
+        return get_archetype(type(self))
+
     def __hash__(self):
         return hash(self._id)
 
@@ -639,6 +1142,35 @@ class Entity:
             return False
 
 
+class Archetype:
+    """Read-only metadata for a type of entity, so you don't have to build one just to look at it."""
+
+    def __init__(self, entity_type):
+        example = entity_type()
+
+        self.entity_type = entity_type
+        self.name = example.get_name()
+        self.color = example.get_base_color()
+        self.shop_icon = example.get_shop_icon() if example.is_tower() else example.get_char()
+        self.gold_cost = example.get_gold_cost()
+
+    def create(self):
+        return self.entity_type()
+
+    def __repr__(self):
+        return "Archetype({})".format(self.name)
+
+
+_ARCHETYPES = {}  # entity type -> Archetype
+
+
+def get_archetype(entity_type) -> Archetype:
+    """entity_type: an Entity subclass that can be constructed without arguments."""
+    if entity_type not in _ARCHETYPES:
+        _ARCHETYPES[entity_type] = Archetype(entity_type)
+    return _ARCHETYPES[entity_type]
+
+
 def generate_world(w, h, spawner):
     # TODO some sweet world generation code
     res = World(w, h, spawner)